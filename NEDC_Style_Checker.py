@@ -17,13 +17,51 @@
 
 # import system modules
 #
+import array
+import ast
 import bisect
+import collections
+import concurrent.futures
+import fnmatch
+import hashlib
 import inspect
+import io
+import json
 import keyword
+import mmap
+import multiprocessing
+import operator
 import os
+import platform
+import random
 import re
+import signal
+import socket
+import socketserver
+import stat
+import subprocess
 import sys
+import tempfile
+import threading
+import time
 import tokenize
+import types
+import urllib.parse
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+try:
+    import numpy
+except ImportError:  # the batch physical pass falls back to pure python
+    numpy = None
 
 # import nedc_modules
 #
@@ -50,6 +88,97 @@ USAGE_FILE = \
     "$NEDC_NFC/util/python/nedc_style_checker/nedc_style_checker.usage"
 
 DEF_PYTHON_HEADER = "python"
+
+# define how python scripts are recognized in a directory: by their
+# extension, or by a shebang in the first bytes of a file that has none,
+# and the directories that are never entered
+#
+DEF_PYTHON_EXTENSION = ".py"
+DEF_SHEBANG_SIZE = 128
+DEF_WALK_EXCLUDE = ['.git', '.hg', '.svn', '__pycache__']
+
+# define the defaults of the process pool: the number of files sent to a
+# worker at once and the number of pending tasks allowed per worker
+#
+DEF_JOBS = 1
+DEF_POOL_CHUNK = 16
+DEF_POOL_WINDOW = 4
+
+# define the size (in bytes) from which source files are memory-mapped
+#
+DEF_MMAP_SIZE = 1 << 20
+
+# define the number of tokens after which a statement spanning many lines
+# is checked in parts when files are streamed
+#
+DEF_STREAM_TOKENS = 16384
+
+# define the default number of errors after which the checks of a file
+# stop (0 for no limit), and the exit status of a run stopped by
+# --fail-fast
+#
+DEF_MAX_ERRORS = 0
+DEF_FAIL_STATUS = 1
+
+# define the physical checks the batch pass runs only on the rows it
+# flags: long lines for the first, the last line for the second
+#
+BATCH_PHYSICAL_CHECKS = ('maximum_line_length', 'trailing_blank_lines')
+
+# define how often (in seconds) the daemon checks for a reload request
+#
+DEF_DAEMON_TIMEOUT = 0.5
+
+# define the number of requests after which a daemon that is never idle
+# prunes its cache
+#
+DEF_DAEMON_PRUNE = 64
+
+# define the output formats, the version of SARIF written, and the base
+# the relative paths of a SARIF log are resolved against
+#
+OUTPUT_FORMATS = ['text', 'jsonl', 'sarif']
+DEF_FORMAT = 'text'
+SARIF_VERSION = '2.1.0'
+SARIF_BASE_ID = 'SRCROOT'
+SARIF_SCHEMA = \
+    'https://json.schemastore.org/sarif-2.1.0.json'
+
+# define the defaults of the benchmark: the shapes of the generated files,
+# the number of files per shape and the size of each file
+#
+BENCH_SHAPES = ['compliant', 'functions', 'long_lines', 'nesting',
+                'docstrings']
+DEF_BENCH_FILES = 50
+DEF_BENCH_SIZE = 100
+DEF_BENCH_SEED = 0
+
+# define the default size (in MB) of the result cache and the version of
+# its entries
+#
+DEF_CACHE_SIZE = 256
+CACHE_VERSION = 3
+
+# define the magic number starting a baseline file, followed by its
+# sorted 64-bit fingerprints in little-endian order
+#
+BASELINE_MAGIC = b'NEDCBL1\n'
+
+# define the number of rows taken by a file header that has no closing
+# line, and the git command used by the incremental mode, with the C
+# escapes of the paths it quotes
+#
+DEF_HEADER_ROWS = 11
+NEDC_ARGUMENT_COMMENT = '# argument:'
+NEDC_FUNCTION_COMMENT = '# function:'
+NEDC_GENERAL_IMPORT_COMMENT = '# import system modules'
+NEDC_MAIN_FUNCTION_COMMENT = '# function: main'
+NEDC_NEDC_IMPORT_COMMENT = '# import nedc_modules'
+GIT_DIFF = ['git', '-c', 'core.quotePath=false', 'diff', '-U0', '--no-color',
+            '--no-ext-diff', '--no-prefix', '--diff-filter=ACMR']
+GIT_ESCAPES = {b'a': b'\a', b'b': b'\b', b't': b'\t', b'n': b'\n', b'v': b'\v',
+               b'f': b'\f', b'r': b'\r'}
+
 # Number of blank lines between various code parts.
 BLANK_LINES_CONFIG = {
     # Top level class and function.
@@ -61,6 +190,7 @@ INDENT_SIZE = 4
 MAX_DOC_LENGTH = 80
 MAX_LINE_LENGTH = 80
 REPORT_FORMAT = '%(path)s:%(row)d:%(col)d: %(text)s'
+TRUNCATED_FORMAT = '%(path)s: stopped after %(count)d errors'
 
 # declare a global debug object so we can use it in functions
 #
@@ -79,6 +209,10 @@ DOCSTRING_REGEX = re.compile(r'u?r?["\']')
 DUNDER_REGEX = re.compile(r"^__([^\s]+)__(?::\s*[a-zA-Z.0-9_\[\]\"]+)? = ")
 ERRORCODE_REGEX = re.compile(r'\b[A-Z]\d{3}\b')
 EXTRANEOUS_WHITESPACE_REGEX = re.compile(r'[\[({][ \t]|[ \t][\]}),;:](?!=)')
+FUSED_SCAN_REGEX = re.compile(
+    r'(?=[\s\[({]|\Ae)(?:(?P<tab>\t)|(?P<spacing>\s)(?=\s)|'
+    r'(?P<brackets>[\[({](?=[ \t])|[ \t](?=[\]}),;:]))|'
+    r'(?P<bare_except>\Aexcept(?=\s*:)))')
 KEYWORDS = frozenset(keyword.kwlist + ['print', 'async']) - frozenset(['False', 'None', 'True'])
 KEYWORD_REGEX = re.compile(r'(\s*)\b(?:%s)\b(\s*)' % r'|'.join(KEYWORDS))
 NEWLINE = frozenset([tokenize.NL, tokenize.NEWLINE])
@@ -86,6 +220,7 @@ OPERATOR_REGEX = re.compile(r'(?:[^,\s])(\s*)(?:[-+*/|!<=>%&^]+|:=)(\s*)')
 SKIP_TOKENS = NEWLINE.union([tokenize.INDENT, tokenize.DEDENT])
 SKIP_COMMENTS = SKIP_TOKENS.union([tokenize.COMMENT, tokenize.ERRORTOKEN])
 STARTSWITH_DEF_REGEX = re.compile(r'^(async\s+def|def)\b')
+STARTSWITH_SCOPE_REGEX = re.compile(r'(?:async\s+def|def|class)\s+(\w+)')
 STARTSWITH_TOP_LEVEL_REGEX = re.compile(r'^(async\s+def\s+|def\s+|class\s+|@)')
 UNARY_OPERATORS = frozenset(['>>', '**', '*', '+', '-'])
 WHITESPACE = frozenset(' \t\xa0')
@@ -102,14 +237,31 @@ WS_OPTIONAL_OPERATORS = ARITHMETIC_OP.union(['^', '&', '|', '<<', '>>', '%'])
 #
 #------------------------------------------------------------------------------
 
-NEDC_FILE_HEADER_REGEX = re.compile(r'^#(!/usr/bin/env python)\n^#\n# (file:.*\.py)$\n^#\n^# (revision history:)\n#\n# ([0-9]{8} \([A-Z]{2}\): .*)\n[\s\S]*?(?=\n#-)\n^(#-*)\n$', re.MULTILINE)
-NEDC_FUNCTION_CHECKER_REGEX = re.compile(r'^(async def|def)((?!main).)*$', re.MULTILINE)
-NEDC_FUNCTION_COMMENT_REGEX = re.compile(r'#-*\n# *\n# functions are listed here *\n# *\n#-*', re.MULTILINE)
-NEDC_FUNCTION__HEADER_COMMENT_REGEX = re.compile(r"# function:.*\n#\n# argument:\n[\s\S]*?(?=def)def",re.MULTILINE)
-NEDC_GENERAL_IMPORT_REGEX = re.compile(r'# import system modules\n#\nimport', re.MULTILINE)
-NEDC_GLOBAL_VARIABLE_COMMENT_REGEX = re.compile(r'#-*\n# *\n# global variables are listed here *\n# *\n#-*', re.MULTILINE)
-NEDC_MAIN_FUNCTION_REGEX = re.compile(r'# function: main\n#',re.MULTILINE)
-NEDC_NEDC_IMPORT_REGEX = re.compile(r'# import nedc_modules\n#\nimport nedc', re.MULTILINE)
+# The NEDC template blocks are recognized line by line by NedcScanner:
+# these match a whole line, without its newline
+#
+NEDC_FILE_HEADER_LINES = (
+    re.compile(r'#!/usr/bin/env python'),
+    re.compile(r'#'),
+    re.compile(r'# file:.*\.py'),
+    re.compile(r'#'),
+    re.compile(r'# revision history:'),
+    re.compile(r'#'),
+    re.compile(r'# [0-9]{8} \([A-Z]{2}\): .*'))
+NEDC_DASHES_REGEX = re.compile(r'#-+')
+NEDC_DEF_REGEX = re.compile(r'(?:async\s+)?def\s+(\w+)')
+NEDC_EMPTY_COMMENT_REGEX = re.compile(r'# *')
+NEDC_FUNCTION_COMMENT_REGEX = re.compile(r'# functions are listed here *')
+NEDC_GLOBAL_VARIABLE_COMMENT_REGEX = \
+    re.compile(r'# global variables are listed here *')
+NEDC_DISABLE_FILE_REGEX = re.compile(
+    r'^[ \t]*#\s*(?i:nedc:\s*disable-file)\b'
+    r'(?:\s*=\s*([A-Z]+\d+\b(?:\s*,\s*[A-Z]+\d+\b)*))?', re.MULTILINE)
+NEDC_NOQA_REGEX = re.compile(
+    r'#\s*(?i:noqa|nedc:\s*disable(-file)?)\b'
+    r'(?:\s*[:=]\s*([A-Z]+\d+\b(?:\s*,\s*[A-Z]+\d+\b)*))?')
+NEDC_HUNK_REGEX = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+NEDC_STRUCTURE_REGEX = re.compile(r'#|def|^\s*(?:import|from)\b')
 
 #------------------------------------------------------------------------------
 #
@@ -173,10 +325,45 @@ NEDC_MAIN_FUNCTION_STRING = \
 #
 """
 
+# define the code of each NEDC file check and the message it prints
+#
+NEDC_MESSAGES = {
+    'N101': "\nAt the top of your script please make sure to have: \n" +
+            NEDC_FILE_HEADER_STRING,
+    'N102': "\nAt the top of your import please add: \n" +
+            NEDC_GENERAL_IMPORT_STRING,
+    'N103': "\nAt the top of your NEDC modules import please add: \n" +
+            NEDC_NEDC_IMPORT_STRING,
+    'N104': "\nPlease include and put your global variable under: \n" +
+            NEDC_GLOBAL_VARIABLE_COMMENT_STRING,
+    'N105': "\nPlease include and put your function(s) under: \n" +
+            NEDC_FUNCTION_COMMENT_STRING,
+    'N106': "\nPlease define the top of each function with this format:\n" +
+            NEDC_FUNCTION_HEADER_COMMENT_STRING,
+    'N107': "\nAt the top of your main function please add \n" +
+            NEDC_MAIN_FUNCTION_STRING,
+}
+
+# define the message printed for a file without errors
+#
+NEDC_CLEAN_MESSAGE = \
+    "Check Completed. Congratulations, your script has been Isipify!"
+
 # A dictionary that stores all the condition that each line
-# are tested on
+# are tested on. it is read-only: registering a check replaces it with
+# an updated copy, so a run keeps the tables it started with while
+# another thread registers a check
+#
+nedc_checks = types.MappingProxyType({
+    kind: types.MappingProxyType({})
+    for kind in ('physical_line', 'logical_line', 'tree')})
+nedc_register_lock = threading.Lock()
+
+# the checker owned by a worker of the process pool, and the run context
+# of each thread using the in-memory api
 #
-nedc_checks = {'physical_line': {}, 'logical_line': {}, 'tree': {}}
+nedc_worker = None
+nedc_api = threading.local()
 
 #------------------------------------------------------------------------------
 #
@@ -188,13 +375,20 @@ nedc_checks = {'physical_line': {}, 'logical_line': {}, 'tree': {}}
 #
 # argument:
 #   fname: path to python script
+#   source: the SourceFile of the script if it has already been read
 #
 # return: True if file is an python script
 #
 # this function check the beginning of the file, and decides
 # if the file is python script
 #
-def is_python(fname):
+def is_python(fname, source=None):
+
+    # use the first line of the file if it has already been read
+    #
+    if source is not None:
+        header = source.lines[0] if source.lines else ''
+        return DEF_PYTHON_HEADER in header
 
     # open the file
     #
@@ -245,15 +439,25 @@ def nedc_get_parameters(function):
 #
 # return: list of arguments in a function
 #
-# Register a new object as a condition to nedc_checks
+# Register a new object as a condition to nedc_checks. the registry is
+# copied with the new check and swapped in one assignment, so readers
+# never see it change
 #
 def nedc_register_check(check, codes=None):
 
     def _add_check(check, kind, codes, args):
-        if check in nedc_checks[kind]:
-            nedc_checks[kind][check][0].extend(codes or [])
-        else:
-            nedc_checks[kind][check] = (codes or [''], args)
+        global nedc_checks
+        with nedc_register_lock:
+            checks = dict(nedc_checks[kind])
+            if check in checks:
+                (old_codes, args) = checks[check]
+                checks[check] = (old_codes + tuple(codes or ()), args)
+            else:
+                checks[check] = (tuple(codes or ('',)),
+                                 None if args is None else tuple(args))
+            registry = dict(nedc_checks)
+            registry[kind] = types.MappingProxyType(checks)
+            nedc_checks = types.MappingProxyType(registry)
     if inspect.isfunction(check):
         args = nedc_get_parameters(check)
         if args and args[0] in ('physical_line', 'logical_line'):
@@ -262,19 +466,176 @@ def nedc_register_check(check, codes=None):
             _add_check(check, args[0], codes, args)
     elif inspect.isclass(check):
         if nedc_get_parameters(check.__init__)[:2] == ['self', 'tree']:
+            if codes is None:
+                codes = ERRORCODE_REGEX.findall(check.__doc__ or '')
             _add_check(check, 'tree', codes, None)
     
     return check
 
+# function: nedc_compile_check
+#
+# argument:
+#   name: the name of the check
+#   check: the check function
+#   argument_names: the names of its arguments
+#
+# return: a function running the check on a Checker
+#
+# this function builds, once, a call of the check that reads all of its
+# arguments from the Checker with a single attrgetter, instead of binding
+# them by name on every line. only the checks taking a checker_state look
+# up their state.
+#
+def nedc_compile_check(name, check, argument_names):
+
+    # the state of a check is kept by name, for each file
+    #
+    if 'checker_state' in argument_names:
+        getters = [operator.attrgetter(argument)
+                   if argument != 'checker_state' else
+                   (lambda self: self._checker_states.setdefault(name, {}))
+                   for argument in argument_names]
+        return lambda self: check(*[get(self) for get in getters])
+
+    # attrgetter returns a tuple only for more than one argument
+    #
+    if not argument_names:
+        return lambda self: check()
+    get = operator.attrgetter(*argument_names)
+    if len(argument_names) == 1:
+        return lambda self: check(get(self))
+    return lambda self: check(*get(self))
+
+# function: nedc_compile_tree_check
+#
+# argument:
+#   check: the class of a tree check
+#
+# return: a tuple of (node class name, method name) for each visit method
+#
+# this function finds, once, the visit_<node> methods of a tree check, so
+# a single walk of the tree can call the methods of every check on each
+# node instead of walking the tree once per check
+#
+def nedc_compile_tree_check(check):
+    return tuple((name[len('visit_'):], name) for name in sorted(dir(check))
+                 if name.startswith('visit_') and
+                 callable(getattr(check, name)))
+
+# function: nedc_fuse_checks
+#
+# argument:
+#   checks: the (name, check, argument names) of the checks of a table
+#   profile: the CheckProfile of the run, or None
+#
+# return: a tuple (scan, triggers) of the function finding the groups of
+#  FUSED_SCAN_REGEX on a line, and a dictionary mapping each group to the
+#  (name, run) of the checks it triggers, or None when none is fused
+#
+# this function plans, once per table, the fused scan of the checks of
+# FUSED_LOGICAL_CHECKS it holds. when the run is profiled, the scan is
+# timed under its own name, and each check only when it runs.
+#
+def nedc_fuse_checks(checks, profile=None):
+    triggers = {}
+    for name, check, args in checks:
+        if check in FUSED_LOGICAL_CHECKS:
+            run = nedc_compile_check(name, check, args)
+            if profile is not None:
+                run = profile.wrap(name, run, True)
+            for group in FUSED_LOGICAL_CHECKS[check]:
+                triggers.setdefault(group, []).append((name, run))
+    if not triggers:
+        return None
+    scan = nedc_fused_groups
+    if profile is not None:
+        scan = profile.wrap(scan.__name__, scan)
+    return scan, triggers
+
+# function: nedc_compile_fused_check
+#
+# argument:
+#   name: the name of a fused check
+#   plan: the plan of its table, from nedc_fuse_checks
+#
+# return: a function returning the errors of the check on a Checker
+#
+# this function stands for a fused check in its table: the first of
+# them to run on a logical line scans it for all of them
+#
+def nedc_compile_fused_check(name, plan):
+    return lambda self: self.fused_results(plan).get(name, ())
+
+# function: nedc_fused_groups
+#
+# argument:
+#   line: a logical line
+#
+# return: the set of the groups of FUSED_SCAN_REGEX found on the line, or
+#  None when there is none
+#
+# this function goes over the logical line once with FUSED_SCAN_REGEX.
+# each group only takes the first character of what it finds and looks
+# ahead for the rest, so no group hides another one starting on the next
+# character.
+#
+def nedc_fused_groups(line):
+    return {hit.lastgroup for hit in FUSED_SCAN_REGEX.finditer(line)} or None
+
+# function: nedc_fused_scan
+#
+# argument:
+#   plan: a plan returned by nedc_fuse_checks
+#   checker: the Checker holding the logical line
+#
+# return: a dictionary mapping the name of each check that ran to the
+#  list of its errors
+#
+# this function runs, once per line, the checks triggered by the groups
+# found on the logical line. the other checks cannot report anything on
+# the line, so they are not run at all.
+#
+def nedc_fused_scan(plan, checker):
+    scan, triggers = plan
+    results = {}
+    for group in scan(checker.logical_line) or ():
+        for name, run in triggers.get(group, ()):
+            if name not in results:
+                results[name] = list(run(checker) or ())
+    return results
+
+# function: nedc_batch_rows
+#
+# argument:
+#   lines: the lines of a python script
+#   limit: the maximum line length
+#
+# return: a bytes object, indexed by row, that is 1 on the rows the
+#  batched physical checks may report
+#
+# this function measures all the lines of a file in one step, with numpy
+# when it is available. a line no longer than the limit, once stripped,
+# cannot be too long, so only the longer lines and the last line, which
+# the trailing blank line check looks at, are flagged.
+#
+def nedc_batch_rows(lines, limit):
+    total = len(lines)
+    if numpy is not None:
+        flags = numpy.zeros(total + 2, dtype=numpy.uint8)
+        flags[1:total + 1] = numpy.fromiter(map(len, lines), dtype=numpy.intp,
+                                            count=total) > limit
+        flags[total] = 1
+        return flags.tobytes()
+    flags = bytearray(total + 2)
+    for row, length in enumerate(map(len, lines), 1):
+        if length > limit:
+            flags[row] = 1
+    flags[total] = 1
+    return bytes(flags)
+
 def readlines(filename):
     """Read the source code."""
-    try:
-        with tokenize.open(filename) as f:
-            return f.readlines()
-    except (LookupError, SyntaxError, UnicodeError):
-        # Fall back if file encoding is improperly declared
-        with open(filename, encoding='latin-1') as f:
-            return f.readlines()
+    return SourceFile(filename).lines
 
 def expand_indent(line):
     r"""Return the amount of indentation.
@@ -343,9 +704,9 @@ def trailing_blank_lines(physical_line, lines, line_number, total_lines):
     if line_number == total_lines:
         stripped_last_line = physical_line.rstrip('\r\n')
         if physical_line != "# end of file" and not stripped_last_line:
-            return 0, "     missing '# end of file' at end of file"
+            return 0, "W391 missing '# end of file' at end of file"
         if stripped_last_line == physical_line:
-            return len(lines[-1]), "     no newline at end of file"
+            return len(lines[-1]), "W292 no newline at end of file"
 
 @nedc_register_check
 def maximum_line_length(physical_line, max_line_length, multiline,
@@ -382,14 +743,13 @@ def maximum_line_length(physical_line, max_line_length, multiline,
             except UnicodeError:
                 pass
         if length > max_line_length:
-            return (max_line_length, "line too long "
+            return (max_line_length, "E501 line too long "
                     "(%d > %d characters)" % (length, max_line_length))
 
 @nedc_register_check
-def blank_lines(logical_line, blank_lines, indent_level, line_number,
-                blank_before, previous_logical,
-                previous_unindented_logical_line, previous_indent_level,
-                lines):
+def blank_lines(logical_line, blank_lines, indent_level, blank_before,
+                previous_logical, previous_unindented_logical_line,
+                previous_indent_level, ancestors):
     r"""Separate top-level function and class definitions by a single blank
     line.
 
@@ -425,35 +785,26 @@ def blank_lines(logical_line, blank_lines, indent_level, line_number,
         return  # Don't expect blank lines before the first line
     if previous_logical.startswith('@'):
         if blank_lines:
-            yield 0, "blank lines found after function decorator"
+            yield 0, "E304 blank lines found after function decorator"
     elif (blank_lines > top_level_lines or
             (indent_level and blank_lines == method_lines + 1)
           ):
-        yield 0, "too many blank lines (%d)" % blank_lines
+        yield 0, "E303 too many blank lines (%d)" % blank_lines
     elif STARTSWITH_TOP_LEVEL_REGEX.match(logical_line):
         if indent_level:
             if not (blank_before == method_lines or
                     previous_indent_level < indent_level or
                     DOCSTRING_REGEX.match(previous_logical)
                     ):
-                ancestor_level = indent_level
-                nested = False
-                # Search backwards for a def ancestor or tree root
-                # (top level).
-                for line in lines[line_number - top_level_lines::-1]:
-                    if line.strip() and expand_indent(line) < ancestor_level:
-                        ancestor_level = expand_indent(line)
-                        nested = STARTSWITH_DEF_REGEX.match(line.lstrip())
-                        if nested or ancestor_level == 0:
-                            break
-                if nested:
-                    yield 0, "expected %s blank line before a " \
+                # the innermost ancestor knows whether a def encloses it
+                if ancestors and ancestors[-1][1]:
+                    yield 0, "E306 expected %s blank line before a " \
                         "nested definition, found 0" % (method_lines)
                 else:
-                    yield 0, "expected {} blank line, found 0".format(
+                    yield 0, "E301 expected {} blank line, found 0".format(
                         method_lines)
         elif blank_before != top_level_lines:
-            yield 0, "expected %s blank lines, found %d" % (
+            yield 0, "E302 expected %s blank lines, found %d" % (
                 top_level_lines, blank_before)
    
 
@@ -484,7 +835,7 @@ def extraneous_whitespace(logical_line):
         found = match.start()
         if text[-1].isspace():
             # assert char in '([{'
-            yield found + 1, "whitespace after '%s'" % char
+            yield found + 1, "E201 whitespace after '%s'" % char
         elif line[found - 1] != ',':
             code = ('E202' if char in '}])' else 'E203')  # if char in ',;:'
             yield found, f"{code} whitespace before '{char}'"
@@ -495,7 +846,7 @@ def whitespace_around_keywords(logical_line):
 
     Okay: True and False
     E271: True and  False
-    : True  and False
+    E272: True  and False
     E273: True and\tFalse
     E274: True\tand False
     """
@@ -503,14 +854,14 @@ def whitespace_around_keywords(logical_line):
         before, after = match.groups()
 
         if '\t' in before:
-            yield match.start(1), "tab before keyword"
+            yield match.start(1), "E274 tab before keyword"
         elif len(before) > 1:
-            yield match.start(1), "multiple spaces before keyword"
+            yield match.start(1), "E272 multiple spaces before keyword"
 
         if '\t' in after:
-            yield match.start(2), "tab after keyword"
+            yield match.start(2), "E273 tab after keyword"
         elif len(after) > 1:
-            yield match.start(2), "multiple spaces after keyword"
+            yield match.start(2), "E271 multiple spaces after keyword"
 
 @nedc_register_check
 def missing_whitespace_after_import_keyword(logical_line):
@@ -527,7 +878,7 @@ def missing_whitespace_after_import_keyword(logical_line):
         found = line.find(indicator)
         if -1 < found:
             pos = found + len(indicator) - 1
-            yield pos, "missing whitespace after keyword"
+            yield pos, "E275 missing whitespace after keyword"
 
 @nedc_register_check
 def missing_whitespace(logical_line):
@@ -556,7 +907,7 @@ def missing_whitespace(logical_line):
                 continue  # Allow tuple with only one element: (3,)
             if char == ':' and next_char == '=' and sys.version_info >= (3, 8):
                 continue  # Allow assignment expression
-            yield index, "missing whitespace after '%s'" % char
+            yield index, "E231 missing whitespace after '%s'" % char
 
 @nedc_register_check
 def whitespace_before_parameters(logical_line, tokens):
@@ -592,7 +943,7 @@ def whitespace_before_parameters(logical_line, tokens):
                 not keyword.issoftkeyword(prev_text)
             )
         ):
-            yield prev_end, "whitespace before '%s'" % text
+            yield prev_end, "E211 whitespace before '%s'" % text
         prev_type = token_type
         prev_text = text
         prev_end = end
@@ -611,14 +962,14 @@ def whitespace_around_operator(logical_line):
         before, after = match.groups()
 
         if '\t' in before:
-            yield match.start(1), "tab before operator"
+            yield match.start(1), "E223 tab before operator"
         elif len(before) > 1:
-            yield match.start(1), "multiple spaces before operator"
+            yield match.start(1), "E221 multiple spaces before operator"
 
         if '\t' in after:
-            yield match.start(2), "tab after operator"
+            yield match.start(2), "E224 tab after operator"
         elif len(after) > 1:
-            yield match.start(2), "multiple spaces after operator"
+            yield match.start(2), "E222 multiple spaces after operator"
 
 @nedc_register_check
 def missing_whitespace_around_operator(logical_line, tokens):
@@ -667,7 +1018,7 @@ def missing_whitespace_around_operator(logical_line, tokens):
                 # Found a (probably) needed space
                 if need_space is not True and not need_space[1]:
                     yield (need_space[0],
-                           "missing whitespace around operator")
+                           "E225 missing whitespace around operator")
                 need_space = False
             elif text == '>' and prev_text in ('<', '-'):
                 # Tolerate the "<>" operator, even if running Python 3
@@ -691,7 +1042,7 @@ def missing_whitespace_around_operator(logical_line, tokens):
             else:
                 if need_space is True or need_space[1]:
                     # A needed trailing space was not found
-                    yield prev_end, "missing whitespace around operator"
+                    yield prev_end, "E225 missing whitespace around operator"
                 elif prev_text != '**':
                     code, optype = 'E226', 'arithmetic'
                     if prev_text == '%':
@@ -728,7 +1079,7 @@ def missing_whitespace_around_operator(logical_line, tokens):
                 need_space = (prev_end, start != prev_end)
             elif need_space and start == prev_end:
                 # A needed opening space was not found
-                yield prev_end, "missing whitespace around operator"
+                yield prev_end, "E225 missing whitespace around operator"
                 need_space = False
         prev_type = token_type
         prev_text = text
@@ -748,9 +1099,9 @@ def whitespace_around_comma(logical_line):
     for m in WHITESPACE_AFTER_COMMA_REGEX.finditer(line):
         found = m.start() + 1
         if '\t' in m.group():
-            yield found, "tab after '%s'" % m.group()[0]
+            yield found, "E242 tab after '%s'" % m.group()[0]
         else:
-            yield found, "multiple spaces after '%s'" % m.group()[0]
+            yield found, "E241 multiple spaces after '%s'" % m.group()[0]
 
 @nedc_register_check
 def whitespace_before_comment(logical_line, tokens):
@@ -782,17 +1133,17 @@ def whitespace_before_comment(logical_line, tokens):
             if inline_comment:
                 if prev_end[0] == start[0] and start[1] < prev_end[1] + 2:
                     yield (prev_end,
-                           "at least two spaces before inline comment")
+                           "E261 at least two spaces before inline comment")
             symbol, sp, comment = text.partition(' ')
             bad_prefix = symbol not in '#:' and (symbol.lstrip('#')[:1] or '#')
             if inline_comment:
                 if bad_prefix or comment[:1] in WHITESPACE:
-                    yield start, "inline comment should start with '#'"
+                    yield start, "E262 inline comment should start with '#'"
             elif bad_prefix and (bad_prefix != '!' or start[0] > 1):
                 if bad_prefix != '-':
-                    yield start, "block comment should start with '-'"
+                    yield start, "E265 block comment should start with '-'"
                 elif comment:
-                    yield start, "too many leading '#' for block comment"
+                    yield start, "E266 too many leading '#' for block comment"
         elif token_type != tokenize.NL:
             prev_end = end
 
@@ -813,7 +1164,7 @@ def imports_on_separate_lines(logical_line):
     if line.startswith('import '):
         found = line.find(',')
         if -1 < found and ';' not in line[:found]:
-            yield found, "multiple imports on one line"
+            yield found, "E401 multiple imports on one line"
 
 @nedc_register_check
 def module_imports_on_top_of_file(logical_line, indent_level, checker_state):
@@ -853,7 +1204,7 @@ def module_imports_on_top_of_file(logical_line, indent_level, checker_state):
     line = logical_line
     if line.startswith('import ') or line.startswith('from '):
         if checker_state.get('seen_non_imports', False):
-            yield 0, "module level import not at top of file"
+            yield 0, "E402 module level import not at top of file"
     elif re.match(DUNDER_REGEX, line):
         return
     elif any(line.startswith(kw) for kw in allowed_keywords):
@@ -882,7 +1233,7 @@ def bare_except(logical_line):
 
     match = BLANK_EXCEPT_REGEX.match(logical_line)
     if match:
-        yield match.start(), "do not use bare 'except'"
+        yield match.start(), "E722 do not use bare 'except'"
 
 @nedc_register_check
 def maximum_doc_length(logical_line, max_doc_length, tokens):
@@ -937,58 +1288,516 @@ def maximum_doc_length(logical_line, max_doc_length, tokens):
                                % (length, max_doc_length))
         prev_token = token_type
 
-def nedc_header_check(file):
-    if not re.match(NEDC_FILE_HEADER_REGEX, file):
-        return print(f"\nAt the top of your script please make sure to have: \n{NEDC_FILE_HEADER_STRING}")
+def nedc_header_check(scan):
+    """The script starts with the NEDC file header (N101)."""
+    if not scan.header:
+        return 1, 'N101'
+
+def nedc_gen_import_check(scan):
+    """The system imports are under their NEDC comment (N102)."""
+    if scan.gen_import is None:
+        return scan.first_import or 1, 'N102'
+
+def nedc_nedc_import_check(scan):
+    """The NEDC imports are under their NEDC comment (N103)."""
+    if scan.nedc_import is None:
+        return scan.first_nedc_import or 1, 'N103'
+
+def nedc_global_var_header(scan):
+    """The global variables are under their NEDC section (N104)."""
+    if scan.global_var is None:
+        return 1, 'N104'
+
+def nedc_function_header(scan):
+    """The functions are under their NEDC section (N105)."""
+    if scan.function_comment is None:
+        return scan.first_def or 1, 'N105'
+
+def nedc_function_define_header(scan):
+    """Each function has an NEDC function header (N106)."""
+    if len(scan.function_rows) != len(scan.header_rows):
+        return scan.get_missing_header(), 'N106'
+
+def nedc_main_function_header(scan):
+    """The main function has its NEDC comment (N107)."""
+    if scan.main_function is None:
+        return scan.main_def or 1, 'N107'
+
+# The NEDC checks run on the blocks found by NedcScanner, in the order
+# they are reported. Each returns (row, code) when its block is missing,
+# and the code, also given in its docstring, selects its message in
+# NEDC_MESSAGES.
+#
+NEDC_FILE_CHECKS = (nedc_header_check, nedc_gen_import_check,
+                    nedc_nedc_import_check, nedc_global_var_header,
+                    nedc_function_header, nedc_function_define_header,
+                    nedc_main_function_header)
+
+# The logical checks below only report a line on which FUSED_SCAN_REGEX
+# finds one of their groups: a tab or two blanks in a row for the
+# whitespace around keywords, operators and commas, a blank next to a
+# bracket or before a separator for the extraneous whitespace, and the
+# 'except:' at the start of the line for the bare except. A line is then
+# scanned once for all of them, and each runs unchanged only where its
+# group is found, so its messages and offsets are the same.
+#
+FUSED_LOGICAL_CHECKS = {
+    extraneous_whitespace: ('tab', 'brackets'),
+    whitespace_around_keywords: ('tab', 'spacing'),
+    whitespace_around_operator: ('tab', 'spacing'),
+    whitespace_around_comma: ('tab', 'spacing'),
+    bare_except: ('bare_except',)}
+
+# function: nedc_get_codes
+#
+# argument:
+#   codes: a comma separated list of code prefixes, or None
+#
+# return: a tuple of code prefixes, ('',) matching every code for None
+#
+# this function parses the codes of a suppression comment
+#
+def nedc_get_codes(codes):
+    if codes is None:
+        return ('',)
+    return tuple(sorted(set(code.strip().upper()
+                            for code in codes.split(',') if code.strip())))
+
+# function: nedc_file_suppression
+#
+# argument:
+#   text: the text of a python script
+#
+# return: a tuple of the code prefixes suppressed in the whole file
+#
+# this function collects the '# nedc: disable-file[=CODES]' comments of a
+# script. without codes, the comment suppresses every code, and the
+# result is ('',). only whole-line comments count, so the text is
+# searched once, before the file is tokenized.
+#
+def nedc_file_suppression(text):
+    if 'disable-file' not in text:
+        return ()
+    prefixes = set()
+    for match in NEDC_DISABLE_FILE_REGEX.finditer(text):
+        prefixes.update(nedc_get_codes(match.group(1)))
+    if '' in prefixes:
+        return ('',)
+    return tuple(sorted(prefixes))
+
+# function: nedc_header_rows
+#
+# argument:
+#   lines: the lines of a python script
+#
+# return: the number of rows at the top of the file that hold its header
+#
+# this function finds the line closing the NEDC file header, and counts
+# the blank line the template requires after it
+#
+def nedc_header_rows(lines):
+    for row, line in enumerate(lines[:DEF_HEADER_ROWS * 4], 1):
+        if line.startswith('#-'):
+            return row + 1
+    return DEF_HEADER_ROWS
+
+#------------------------------------------------------------------------------
+#
+# classes are listed here
+#
+#------------------------------------------------------------------------------
+
+class NedcScanner():
+    """Recognize the NEDC template blocks in a single pass over the lines.
+
+    Lines are fed one at a time, straight from the reader of the
+    tokenizer, and only the last four are kept. The blocks are the ones
+    the NEDC checks used to search for with regular expressions on the
+    whole text, and each is recorded with the row it starts on (None
+    until it is found).
+    """
 
-def nedc_gen_import_check(file):
-    if not re.search(NEDC_GENERAL_IMPORT_REGEX, file):
-        return print(f"\nAt the top of your import please add: \n{NEDC_GENERAL_IMPORT_STRING}")
-        
-def nedc_nedc_import_check(file):
-    if not re.search(NEDC_NEDC_IMPORT_REGEX, file):
-        return print(f"\nAt the top of your NEDC modules import please add: \n{NEDC_NEDC_IMPORT_STRING}")
+    def __init__(self):
+        self.row = 0
+        self.window = collections.deque([('', False)] * 4, maxlen=4)
+        # file header: rows 1 to 7 are fixed, then a line of dashes
+        # followed by an empty line closes it
+        self.header = False
+        self._header_open = True
+        self._header_close = False
+        self.gen_import = self.nedc_import = None
+        self.global_var = self.function_comment = self.main_function = None
+        self.first_import = self.first_nedc_import = None
+        self.first_def = self.main_def = None
+        # rows of the definitions that need a header, and (header row,
+        # row of the 'def' closing it) for each function header
+        self.function_rows = []
+        self.header_rows = []
+        self._header_start = None
+        self._resume = (0, 0)
+
+    def feed(self, line):
+        """Scan the next physical line."""
+        row = self.row = self.row + 1
+        ended = line[-1:] == '\n'
+        body = line[:-1] if ended else line
+        window = self.window
+        if self._header_open:
+            self.scan_header(row, body, ended)
+
+        if self._header_start is not None:
+            # look for the 'def' closing a function header, anywhere in
+            # the text after its '# argument:' line
+            if row > self._header_start + 2:
+                col = body.find('def')
+                if col >= 0:
+                    self.header_rows.append((self._header_start, row))
+                    self._header_start = None
+                    self._resume = (row, col + 3)
+        elif (body == NEDC_ARGUMENT_COMMENT and ended and
+                window[-1] == ('#', True) and window[-2][1]):
+            # a function header starts on the line before '#', from the
+            # point the previous header ended
+            start = row - 2
+            text = window[-2][0]
+            if start >= self._resume[0]:
+                if start == self._resume[0]:
+                    text = text[self._resume[1]:]
+                if NEDC_FUNCTION_COMMENT in text:
+                    self._header_start = start
+
+        first = body[:1]
+        if first == '#':
+            if window[-1][1] and \
+                    window[-1][0].endswith(NEDC_MAIN_FUNCTION_COMMENT):
+                if self.main_function is None:
+                    self.main_function = row - 1
+            if window[-4][1] and window[-4][0].rstrip('-').endswith('#'):
+                self.scan_section(row, window)
+        elif first == 'i' and body.startswith('import'):
+            nedc = body.startswith('import nedc')
+            if self.first_import is None:
+                self.first_import = row
+            if nedc and self.first_nedc_import is None:
+                self.first_nedc_import = row
+            if window[-1] == ('#', True) and window[-2][1]:
+                comment = window[-2][0]
+                if self.gen_import is None and \
+                        comment.endswith(NEDC_GENERAL_IMPORT_COMMENT):
+                    self.gen_import = row - 2
+                if nedc and self.nedc_import is None and \
+                        comment.endswith(NEDC_NEDC_IMPORT_COMMENT):
+                    self.nedc_import = row - 2
+        elif first == 'f':
+            if body.startswith('from ') and self.first_import is None:
+                self.first_import = row
+        if first == 'd' or first == 'a':
+            # 'def' is a whole word: 'default = 1' is not a definition
+            match = NEDC_DEF_REGEX.match(body)
+            if match is not None:
+                self.scan_def(row, match.group(1))
+        window.append((body, ended))
+
+    def scan_header(self, row, body, ended):
+        """Follow the file header through its first lines."""
+        if row <= len(NEDC_FILE_HEADER_LINES):
+            if not (ended and NEDC_FILE_HEADER_LINES[row - 1].fullmatch(body)):
+                self._header_open = False
+            return
+        if self._header_close and not body:
+            self.header = True
+            self._header_open = False
+            return
+        # the closing dashes need at least one line before them
+        self._header_close = (row > len(NEDC_FILE_HEADER_LINES) + 1 and
+                              ended and
+                              NEDC_DASHES_REGEX.fullmatch(body) is not None)
+
+    def scan_section(self, row, window):
+        """Recognize the section comments ending on the current row."""
+        if not (window[-3][1] and window[-1][1] and window[-2][1] and
+                NEDC_EMPTY_COMMENT_REGEX.fullmatch(window[-3][0]) and
+                NEDC_EMPTY_COMMENT_REGEX.fullmatch(window[-1][0])):
+            return
+        if NEDC_GLOBAL_VARIABLE_COMMENT_REGEX.fullmatch(window[-2][0]):
+            if self.global_var is None:
+                self.global_var = row - 4
+        elif NEDC_FUNCTION_COMMENT_REGEX.fullmatch(window[-2][0]):
+            if self.function_comment is None:
+                self.function_comment = row - 4
+
+    def scan_def(self, row, name):
+        """Record a top-level definition of the function name.
+
+        Only the function named 'main' is the main function, as in
+        scan_tree. This guess from the lines is what a file that is not
+        parsed, such as a streamed file, is checked with, and it still
+        differs from the tree on a line starting with 'def' inside a
+        multiline string, and on a definition whose name is on the next
+        line, after a backslash.
+        """
+        if self.first_def is None:
+            self.first_def = row
+        if name != 'main':
+            self.function_rows.append(row)
+        elif self.main_def is None:
+            self.main_def = row
+
+    def scan_tree(self, tree):
+        """Take the definitions from the tree of a valid file.
+
+        A line starting with 'def' is only a guess: the tree holds the
+        real top-level functions, without the names such as 'default'
+        or the text of strings that the lines can be mistaken for. The
+        headers are still found on the lines, since they are comments.
+        """
+        self.first_def = self.main_def = None
+        self.function_rows = []
+        for node in tree.body:
+            if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            if self.first_def is None:
+                self.first_def = node.lineno
+            if node.name != 'main':
+                self.function_rows.append(node.lineno)
+            elif self.main_def is None:
+                self.main_def = node.lineno
+
+    def close(self):
+        """Signal the end of the file."""
+        if self._header_open and self._header_close:
+            self.header = True
+        self._header_open = False
+
+    def get_missing_header(self):
+        """Return the row of the first definition without a header."""
+        closed = set(row for start, row in self.header_rows)
+        for row in self.function_rows:
+            if row not in closed:
+                return row
+        defined = set(self.function_rows)
+        for start, row in self.header_rows:
+            if row not in defined:
+                return start
+        return 1
+#
+# end of class
 
-def nedc_global_var_header(file):
-    if not re.search(NEDC_GLOBAL_VARIABLE_COMMENT_REGEX, file):
-        return print(f"\nPlease include and put your global variable under: \n{NEDC_GLOBAL_VARIABLE_COMMENT_STRING}")
+class SourceFile():
+    """Read a source file once and share it between all the checks.
 
-def nedc_function_header(file):
-    if not re.search(NEDC_FUNCTION_COMMENT_REGEX, file):
-        return print(f"\nPlease include and put your function(s) under: \n{NEDC_FUNCTION_COMMENT_STRING}")
+    The file is read as bytes in a single call (or memory-mapped when it
+    is large), its encoding is detected once, and the decoded text and
+    lines are used by the NEDC header checks, the tokenizer and the
+    physical line checks alike.
+    """
 
-def nedc_function_define_header(file):
-    if len(re.findall(NEDC_FUNCTION_CHECKER_REGEX, file)) != len(re.findall(NEDC_FUNCTION__HEADER_COMMENT_REGEX, file)):
-        return print(f"\nPlease define the top of each function with this format:\n{NEDC_FUNCTION_HEADER_COMMENT_STRING}")
+    def __init__(self, filename, data=None):
+        self.filename = filename
+        if data is not None:
+            # source given in memory, as bytes or as text
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            self.digest = self.hash(data)
+            self.text = self.decode(data, io.BytesIO(data).readline)
+        else:
+            self.read(filename)
+        # Universal newlines, as tokenize.open() would read them
+        if '\r' in self.text:
+            self.text = self.text.replace('\r\n', '\n').replace('\r', '\n')
+        self.lines = io.StringIO(self.text).readlines()
+
+    def read(self, filename):
+        """Read and decode the raw source from the disk."""
+        with open(filename, 'rb') as fp:
+            size = os.fstat(fp.fileno()).st_size
+            if size >= DEF_MMAP_SIZE:
+                with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    self.digest = self.hash(data)
+                    self.text = self.decode(data, data.readline)
+            else:
+                data = fp.read()
+                self.digest = self.hash(data)
+                self.text = self.decode(data, io.BytesIO(data).readline)
 
-def nedc_main_function_header(file):
-    if not re.search(NEDC_MAIN_FUNCTION_REGEX, file):
-        return print(f"\nAt the top of your main function please add \n{NEDC_MAIN_FUNCTION_STRING}")
+    def hash(self, data):
+        """Return the hash of the raw source, used as the cache key."""
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
 
-#------------------------------------------------------------------------------
+    def decode(self, data, readline):
+        """Decode the raw source with its declared encoding."""
+        try:
+            self.encoding, _ = tokenize.detect_encoding(readline)
+            return str(data, self.encoding)
+        except (LookupError, SyntaxError, UnicodeError):
+            # Fall back if file encoding is improperly declared
+            self.encoding = 'latin-1'
+            return str(data, self.encoding)
 #
-# classes are listed here
+# end of class
+
+class LineStream():
+    """Read a source file one line at a time, keeping a window of lines.
+
+    A first pass over the file counts its lines, checks its encoding and
+    finds the comments suppressing codes in the whole file, keeping
+    nothing else. The lines are then read again as the checker asks for
+    them, indexed like a list of lines, and the lines before the logical
+    line being checked are released, so the memory used does not grow
+    with the size of the file.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        try:
+            self.scan('utf-8', True)
+        except (LookupError, SyntaxError, UnicodeError):
+            # Fall back if file encoding is improperly declared
+            self.scan('latin-1', False)
+        self.fp = open(filename, encoding=self.encoding, newline=None)
+        # the lines kept, and the index of the first one
+        self.window = collections.deque()
+        self.first = 0
+
+    def scan(self, encoding, detect):
+        """Count the lines and find the file suppression comments."""
+        self.encoding = encoding
+        if detect:
+            with open(self.filename, 'rb') as fp:
+                self.encoding, _ = tokenize.detect_encoding(fp.readline)
+        self.total = 0
+        comments = []
+        with open(self.filename, encoding=self.encoding,
+                  newline=None) as fp:
+            for line in fp:
+                self.total += 1
+                if 'disable-file' in line:
+                    comments.append(line)
+        self.suppressed = nedc_file_suppression(''.join(comments))
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, index):
+        """Return a line of the window, reading up to it if needed."""
+        if index < 0:
+            index += self.total
+        while index >= self.first + len(self.window):
+            line = self.fp.readline()
+            if not line:
+                raise IndexError('line %d is past the end of %s' %
+                                 (index + 1, self.filename))
+            if not self.first and not self.window:
+                # strip the UTF-8 BOM the latin-1 fallback leaves
+                if line[:1] == '\ufeff':
+                    line = line[1:]
+                elif line[:3] == '\xef\xbb\xbf':
+                    line = line[3:]
+            self.window.append(line)
+        if index < self.first:
+            raise IndexError('line %d of %s was released' %
+                             (index + 1, self.filename))
+        return self.window[index - self.first]
+
+    def release(self, index):
+        """Forget the lines before index."""
+        window = self.window
+        while self.first < index and window:
+            window.popleft()
+            self.first += 1
+
+    def close(self):
+        """Close the file."""
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 #
-#------------------------------------------------------------------------------
+# end of class
 
 class Checker():
     """Load a Python source file, tokenize it, check coding style."""
 
     def __init__(self, filename=None, lines=None,
-                 options=None, report=None, **kwargs):
-        self._physical_line_checks = FinalReport.get_checks(self,'physical_line')
-        self._logical_line_checks = FinalReport.get_checks(self,'logical_line')
+                 report=None, file_checks=(), checks=None,
+                 profile=None, registry=None, batch=False, fused=True,
+                 **kwargs):
+        self.profile = profile
+        self.selection = None
+        # scan each logical line once for the checks that can be fused
+        self.fused = fused
+        # run the batched physical checks only on the rows they may report
+        self.batch = batch
+        # the registry the tables were built from
+        self.registry = nedc_checks if registry is None else registry
+        if checks is None:
+            checks = {argument_name: FinalReport.compile_checks(
+                self, FinalReport.get_checks(self, argument_name))
+                for argument_name in ('physical_line', 'logical_line',
+                                      'tree')}
+        self._checks = checks
+        self._physical_line_checks = checks['physical_line']
+        self._logical_line_checks = checks['logical_line']
+        # tables of the checks left by each set of suppressed codes
+        self._unsuppressed = {}
+        # record the logical lines and their scopes, for a baseline
+        self.record_logical = False
+        # (indent level, in a def, scope) of the lines enclosing the
+        # current logical line, innermost last
+        self.ancestors = []
         self.max_line_length = MAX_LINE_LENGTH
         self.max_doc_length = MAX_DOC_LENGTH
         self.indent_size = INDENT_SIZE
-        self.multiline = False  # in a multiline string?
-        self.indent_size = INDENT_SIZE
         self.verbose = 0
+        # the report belongs to the run, never to the class
+        self.report = report
+        self.report_error = self.report.error
+        # A checker built without a file is reused through init_file()
+        if filename is not None or lines is not None:
+            self.init_file(filename, lines, file_checks)
+
+    def init_file(self, filename, lines=None, file_checks=(), suppressed=()):
+        """Reset the per-file state to check a new file.
+
+        suppressed holds the code prefixes disabled in the whole file;
+        the checks reporting only those codes are left out of the tables
+        for this file.
+        """
         self.filename = filename
+        self.file_checks = file_checks
+        self.file_suppressed = suppressed
+        # row -> code prefixes suppressed by its comment
+        self.suppressed = {}
+        self._physical_line_checks = self.get_unsuppressed('physical_line',
+                                                           suppressed)
+        self._logical_line_checks = self.get_unsuppressed('logical_line',
+                                                          suppressed)
+        self._tree_checks = self.get_unsuppressed('tree', suppressed)
+        # the physical checks run on the rows the batch pass left out
+        self._physical_unbatched = [
+            entry for entry in self._physical_line_checks
+            if entry[0] not in BATCH_PHYSICAL_CHECKS]
+        self.batch_rows = None
+        # the logical line last scanned for the fused checks, and what
+        # the scan found
+        self._fused_line = None
+        self._fused_plan = None
+        self._fused_results = None
+        self.multiline = False  # in a multiline string?
         # Dictionary where a checker can store its custom state.
         self._checker_states = {}
-        self.lines = readlines(filename)
-        if self.lines:
+        if lines is None:
+            lines = readlines(filename)
+        self.lines = lines
+        # a LineStream, when the lines are read as the file is checked
+        self.stream = lines if isinstance(lines, LineStream) else None
+        # the statement being checked in parts, when it is too long
+        self.continued = False
+        # a LineStream strips the BOM itself, as it reads the first line
+        if self.lines and self.stream is None:
             ord0 = ord(self.lines[0][0])
             if ord0 in (0xef, 0xfeff):  # Strip the UTF-8 BOM
                 if ord0 == 0xfeff:
@@ -996,9 +1805,6 @@ class Checker():
                 elif self.lines[0][:3] == '\xef\xbb\xbf':
                     self.lines[0] = self.lines[0][3:]
 
-        self.report = options.report
-        self.report_error = self.report.error
-
     def readline(self):
         """Get the next line from the input buffer."""
         if self.line_number >= self.total_lines:
@@ -1007,29 +1813,88 @@ class Checker():
         self.line_number += 1
         if self.indent_char is None and line[:1] in WHITESPACE:
             self.indent_char = line[0]
+        if self.scanner is not None:
+            self.scanner.feed(line)
         return line
 
-    def run_check(self, check, argument_names):
-        """Run a check plugin."""
-        arguments = []
-        for name in argument_names:
-            arguments.append(getattr(self, name))
-        return check(*arguments)
+    def get_unsuppressed(self, kind, prefixes):
+        """Return the checks of kind reporting a code not in prefixes."""
+        if not prefixes:
+            return self._checks[kind]
+        key = (kind, prefixes)
+        checks = self._unsuppressed.get(key)
+        if checks is None:
+            checks = self._unsuppressed[key] = [
+                entry for entry in self._checks[kind]
+                if not all(code.startswith(prefixes)
+                           for code in self.registry[kind][entry[1]][0])]
+            if kind == 'logical_line' and self.fused:
+                checks[:] = self.fuse_unsuppressed(checks)
+        return checks
+
+    def fuse_unsuppressed(self, checks):
+        """Plan the fused scan again for the fused checks left.
+
+        The scan of the whole table would still run the checks the
+        suppressed codes left out, only to drop what they found.
+        """
+        plan = nedc_fuse_checks(
+            [(name, check, self.registry['logical_line'][check][1])
+             for name, check, run in checks
+             if check in FUSED_LOGICAL_CHECKS], self.profile)
+        return [(name, check, nedc_compile_fused_check(name, plan))
+                if check in FUSED_LOGICAL_CHECKS else (name, check, run)
+                for name, check, run in checks]
+
+    def add_suppression(self, token):
+        """Index the codes suppressed by a comment on its row."""
+        text = token[1].lower()
+        if 'noqa' not in text and 'nedc:' not in text:
+            return
+        match = NEDC_NOQA_REGEX.search(token[1])
+        if match is None or match.group(1):
+            # the file level comments are read before the file is checked
+            return
+        row = token[2][0]
+        self.suppressed[row] = self.suppressed.get(row, ()) + \
+            nedc_get_codes(match.group(2))
+
+    def fused_results(self, plan):
+        """Return the errors of the fused checks of plan on the line.
 
-    def init_checker_state(self, name, argument_names):
-        """Prepare custom state for the specific checker plugin."""
-        if 'checker_state' in argument_names:
-            self.checker_state = self._checker_states.setdefault(name, {})
+        The logical line is scanned by the first fused check to run on
+        it, and the next ones read the errors the scan found.
+        """
+        if self._fused_line is not self.logical_line or \
+           self._fused_plan is not plan:
+            self._fused_results = nedc_fused_scan(plan, self)
+            self._fused_line = self.logical_line
+            self._fused_plan = plan
+        return self._fused_results
 
     def check_physical(self, line):
         """Run all physical checks on a raw input line."""
         self.physical_line = line
-        for name, check, argument_names in self._physical_line_checks:
-            self.init_checker_state(name, argument_names)
-            result = self.run_check(check, argument_names)
+        checks = self._physical_line_checks
+        prefixes = self.file_suppressed
+        if self.line_number in self.suppressed:
+            prefixes = self.suppressed[self.line_number] + prefixes
+            checks = self.get_unsuppressed('physical_line', prefixes)
+        if self.batch_rows is not None and \
+           not self.batch_rows[self.line_number]:
+            # the batch pass found nothing here for the batched checks
+            if checks is self._physical_line_checks:
+                checks = self._physical_unbatched
+            else:
+                checks = [entry for entry in checks
+                          if entry[0] not in BATCH_PHYSICAL_CHECKS]
+        for name, check, run in checks:
+            result = run(self)
             if result is not None:
                 (offset, text) = result
-                self.report_error(self.line_number, offset, text, check)
+                if prefixes and text.startswith(prefixes):
+                    continue
+                self.report_error(self.line_number, offset, text, name)
                 if text[:4] == 'E101':
                     self.indent_char = line[0]
 
@@ -1065,40 +1930,107 @@ class Checker():
         self.logical_line = ''.join(logical)
         return mapping
 
-    def check_logical(self):
-        """Build a line from tokens and run all logical checks on it."""
-        self.report.increment_logical_line()
+    def enter_logical_line(self):
+        """Leave the blocks that the current logical line is not in.
+
+        The ancestors are the logical lines less indented than the
+        current one, each less indented than the next, which is what a
+        search backwards through the file would find, at the cost of
+        one comparison per block left. Comment lines leave them alone.
+        """
+        ancestors = self.ancestors
+        while ancestors and ancestors[-1][0] >= self.indent_level:
+            ancestors.pop()
+
+    def push_logical_line(self):
+        """Make the current logical line the ancestor of the next ones.
+
+        An entry is (indent level, in a def, scope): in a def is true
+        when the line or one of its ancestors is a def, and scope is the
+        dotted name of the definitions up to and including the line.
+        """
+        (in_def, scope) = (False, '')
+        if self.ancestors:
+            (_, in_def, scope) = self.ancestors[-1]
+        match = STARTSWITH_SCOPE_REGEX.match(self.logical_line)
+        if match:
+            in_def = in_def or bool(
+                STARTSWITH_DEF_REGEX.match(self.logical_line))
+            scope = scope + '.' + match.group(1) if scope else match.group(1)
+        self.ancestors.append((self.indent_level, in_def, scope))
+
+    def record_logical_line(self, start_row):
+        """Record the logical line starting on a row, and its scope.
+
+        The scope is the dotted name of the definitions enclosing the
+        line, taken from its innermost ancestor.
+        """
+        self.logical_starts.append(start_row)
+        self.logical_texts.append(
+            (self.logical_line,
+             self.ancestors[-1][2] if self.ancestors else ''))
+
+    def check_logical(self, partial=False):
+        """Build a line from tokens and run all logical checks on it.
+
+        partial is True when the tokens are only a part of a statement
+        too long to be kept whole. The next parts are checked as its
+        continuation: they keep its indentation, and do not count as
+        logical lines of their own.
+        """
+        if not self.continued:
+            self.report.increment_logical_line()
         mapping = self.build_tokens_line()
         if not mapping:
             return
 
         mapping_offsets = [offset for offset, _ in mapping]
         (start_row, start_col) = mapping[0][1]
-        start_line = self.lines[start_row - 1]
-        self.indent_level = expand_indent(start_line[:start_col])
-        if self.blank_before < self.blank_lines:
-            self.blank_before = self.blank_lines
+        if not self.continued:
+            start_line = self.lines[start_row - 1]
+            self.indent_level = expand_indent(start_line[:start_col])
+            if self.logical_line:
+                self.enter_logical_line()
+            if self.logical_starts is not None:
+                self.record_logical_line(start_row)
+            if self.blank_before < self.blank_lines:
+                self.blank_before = self.blank_lines
         if self.verbose >= 2:
             print(self.logical_line[:80].rstrip())
-        for name, check, argument_names in self._logical_line_checks:
+        checks = self._logical_line_checks
+        prefixes = self.file_suppressed
+        if self.suppressed:
+            # a suppression anywhere in the logical line applies to it
+            for row in range(start_row, self.tokens[-1][3][0] + 1):
+                if row in self.suppressed:
+                    prefixes = self.suppressed[row] + prefixes
+            if prefixes is not self.file_suppressed:
+                checks = self.get_unsuppressed('logical_line', prefixes)
+        for name, check, run in checks:
             if self.verbose >= 4:
                 print('   ' + name)
-            self.init_checker_state(name, argument_names)
-            for offset, text in self.run_check(check, argument_names) or ():
+            for offset, text in run(self) or ():
+                if prefixes and text.startswith(prefixes):
+                    continue
                 if not isinstance(offset, tuple):
                     # As mappings are ordered, bisecting is a fast way
                     # to find a given offset in them.
                     token_offset, pos = mapping[bisect.bisect_left(
                         mapping_offsets, offset)]
                     offset = (pos[0], pos[1] + offset - token_offset)
-                self.report_error(offset[0], offset[1], text, check)
-        if self.logical_line:
+                self.report_error(offset[0], offset[1], text, name)
+        if self.logical_line and not self.continued:
+            self.push_logical_line()
             self.previous_indent_level = self.indent_level
             self.previous_logical = self.logical_line
             if not self.indent_level:
                 self.previous_unindented_logical_line = self.logical_line
+        self.continued = partial
         self.blank_lines = 0
         self.tokens = []
+        if self.stream is not None:
+            # the next logical line starts on the last line read, or after
+            self.stream.release(self.line_number - 1)
 
     def generate_tokens(self):
         """Tokenize file, run physical line checks and yield tokens."""
@@ -1108,6 +2040,8 @@ class Checker():
             for token in tokengen:
                 if token[2][0] > self.total_lines:
                     return
+                if token[0] == tokenize.COMMENT:
+                    self.add_suppression(token)
                 self.maybe_check_physical(token, prev_physical)
                 yield token
                 prev_physical = token[4]
@@ -1146,7 +2080,15 @@ class Checker():
             self.multiline = True
             self.line_number = token[2][0]
             _, src, (_, offset), _, _ = token
-            src = self.lines[self.line_number - 1][:offset] + src
+            # a suppression after the string applies to all its lines
+            match = NEDC_NOQA_REGEX.search(
+                token[4].rstrip('\n').rsplit('\n', 1)[-1])
+            if match is not None and not match.group(1):
+                for row in range(token[2][0], token[3][0]):
+                    self.suppressed[row] = self.suppressed.get(row, ()) + \
+                        nedc_get_codes(match.group(2))
+            # the line of the token starts with the first line of the string
+            src = token[4][:offset] + src
             for line in src.split('\n')[:-1]:
                 self.check_physical(line + '\n')
                 self.line_number += 1
@@ -1156,13 +2098,30 @@ class Checker():
         """Run all checks on the input file."""
         self.report.init_file(self.filename, self.lines)
         self.total_lines = len(self.lines)
+        # a streamed file is never held whole, to be measured at once
+        if self.batch and self.stream is None:
+            self.batch_rows = nedc_batch_rows(self.lines,
+                                              self.max_line_length)
+        self.scanner = NedcScanner() if self.file_checks else None
+        if self.profile is not None and self.scanner is not None:
+            self.scanner.feed = self.profile.wrap('NedcScanner.feed',
+                                                  self.scanner.feed)
         self.line_number = 0
+        # the tree is parsed once, when a check first needs it, and never
+        # for a streamed file, which is not held in memory
+        self.tree = None
+        self.parsed = self.stream is not None
         self.indent_char = None
         self.indent_level = self.previous_indent_level = 0
         self.previous_logical = ''
         self.previous_unindented_logical_line = ''
         self.tokens = []
         self.blank_lines = self.blank_before = 0
+        self.ancestors = []
+        self.logical_starts = None
+        if self.record_logical:
+            self.logical_starts = []
+            self.logical_texts = []
         parens = 0
         for token in self.generate_tokens():
             self.tokens.append(token)
@@ -1179,6 +2138,11 @@ class Checker():
                     parens += 1
                 elif text in '}])':
                     parens -= 1
+            elif parens and token_type == tokenize.NL and \
+                    self.stream is not None and \
+                    len(self.tokens) >= DEF_STREAM_TOKENS:
+                # a streamed statement too long to keep is checked in parts
+                self.check_logical(partial=True)
             elif not parens:
                 if token_type in NEWLINE:
                     if token_type == tokenize.NEWLINE:
@@ -1193,10 +2157,308 @@ class Checker():
         if self.tokens:
             self.check_physical(self.lines[-1])
             self.check_logical()
+        if self._tree_checks and self.get_tree() is not None:
+            self.check_tree()
+        if self.scanner is not None:
+            self.check_file()
         return self.report.get_file_results()
+
+    def get_tree(self):
+        """Return the tree shared by all the checks, parsed on first use.
+
+        The tree is None when the file is not valid Python: the line
+        checks report what the tokenizer could read, and the checks
+        needing the tree are skipped.
+        """
+        if not self.parsed:
+            self.parsed = True
+            try:
+                self.tree = ast.parse(''.join(self.lines),
+                                      self.filename or '<unknown>')
+            except (SyntaxError, ValueError):
+                self.tree = None
+        return self.tree
+
+    def check_tree(self):
+        """Run all the tree checks in a single walk of the tree.
+
+        Each check is built on the tree, and the walk calls its
+        visit_<node> methods on every node of that class. A check may
+        also define run(), called after the walk, so a check walking the
+        tree by itself works too. Both yield (row, col, text) tuples,
+        with col counted from 0.
+        """
+        dispatch = collections.defaultdict(list)
+        finishers = []
+        for name, check, visits in self._tree_checks:
+            instance = check(self.tree)
+            methods = [(node_name, getattr(instance, method))
+                       for node_name, method in visits]
+            if hasattr(instance, 'run'):
+                methods.append((None, instance.run))
+            for node_name, method in methods:
+                if self.profile is not None:
+                    method = self.profile.wrap(name, method, True)
+                if node_name is None:
+                    finishers.append((name, method))
+                else:
+                    dispatch[node_name].append((name, method))
+        if dispatch:
+            for node in ast.walk(self.tree):
+                for name, method in dispatch.get(type(node).__name__, ()):
+                    for result in method(node) or ():
+                        self.report_tree_error(name, result)
+        for name, method in finishers:
+            for result in method() or ():
+                self.report_tree_error(name, result)
+
+    def report_tree_error(self, name, result):
+        """Report a finding of a tree check, unless it is suppressed."""
+        (row, col, text) = result[:3]
+        prefixes = self.suppressed.get(row, ()) + self.file_suppressed
+        if prefixes and text.startswith(prefixes):
+            return
+        self.report_error(row, col, text, name)
+
+    def check_file(self):
+        """Run the NEDC checks on the blocks found in the whole file."""
+        # the tokenizer stops early on invalid input: scan the rest
+        for row in range(self.scanner.row, self.total_lines):
+            self.scanner.feed(self.lines[row])
+            if self.stream is not None:
+                self.stream.release(row)
+        self.scanner.close()
+        # every top-level definition is also a line starting with 'def',
+        # so the tree is only needed to confirm the lines found
+        if self.scanner.first_def is not None and \
+                self.get_tree() is not None:
+            self.scanner.scan_tree(self.tree)
+        for check in self.file_checks:
+            if self.file_suppressed and ERRORCODE_REGEX.search(
+                    check.__doc__).group().startswith(self.file_suppressed):
+                continue
+            result = check(self.scanner)
+            if result is not None:
+                (line_number, code) = result
+                if code.startswith(self.suppressed.get(line_number, ())):
+                    continue
+                self.report.file_error(line_number, code, check.__name__)
 # 
 # end of class
 
+class Finding(collections.namedtuple('Finding',
+                                     ['row', 'col', 'code', 'text', 'check'])):
+    """One error found in a file.
+
+    text is the message of a line check, or None for a NEDC file check,
+    whose message is looked up from its code when the finding is
+    formatted. check is the name of the check that found it.
+    """
+
+    __slots__ = ()
+
+    def get_message(self):
+        """Return the message of the finding."""
+        if self.text is None:
+            return NEDC_MESSAGES[self.code]
+        return self.text
+
+    def get_description(self):
+        """Return the message of the finding without its code."""
+        if self.text is None:
+            return NEDC_MESSAGES[self.code].strip()
+        if self.text.startswith(self.code + ' '):
+            return self.text[len(self.code) + 1:]
+        return self.text
+#
+# end of class
+
+class FileResult():
+    """Hold the findings of one file until they are formatted.
+
+    The NEDC file findings are kept in the order of the checks, and the
+    line findings are sorted by position when the file is complete. A
+    result is small and plain, so it can be cached or sent back from a
+    worker process and formatted once by the parent.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.nedc = []
+        self.findings = []
+        # fingerprints of the findings, when a baseline is written
+        self.fingerprints = None
+        # True when the checks stopped at the error limit of the file
+        self.truncated = False
+
+    @property
+    def errors(self):
+        """Return the number of line findings, as counted in the totals."""
+        return len(self.findings)
+
+    @property
+    def failed(self):
+        """Return True when the file has any finding."""
+        return bool(self.nedc or self.findings)
+#
+# end of class
+
+class TextWriter():
+    """Write the results of each file as soon as it is checked.
+
+    begin() and end() surround the results of a run, and write() is
+    called once per file, in order. The output of a file is built in
+    memory and written as one block, with a single write to the binary
+    buffer below the text stream, so its lines are never interleaved
+    with the output of another process writing to the same pipe or file.
+    The block is flushed at once, so it can be read while the run goes
+    on, and nothing is kept from one file to the next.
+    """
+
+    # the output is read by a machine, and the errors go to stderr
+    machine = False
+
+    def __init__(self, stream=None):
+        self.stream = sys.stdout if stream is None else stream
+        # streams without a binary buffer (StringIO) are written as text
+        self.buffer = getattr(self.stream, 'buffer', None)
+
+    def begin(self):
+        """Start the output of a run."""
+
+    def write(self, result):
+        """Write the results of one file."""
+        self.write_block(self.format(result))
+
+    def write_all(self, results):
+        """Write the results of consecutive files as one block."""
+        self.write_block(''.join([self.format(result)
+                                  for result in results]))
+
+    def write_block(self, text):
+        """Write a block of text in one write, and flush it."""
+        if not text:
+            return
+        if self.buffer is None:
+            self.stream.write(text)
+            self.stream.flush()
+            return
+        # keep the order with what was printed before the block
+        self.stream.flush()
+        self.buffer.write(text.encode(self.stream.encoding,
+                                      self.stream.errors or 'strict'))
+        self.buffer.flush()
+
+    def format(self, result):
+        """Return the text written for one file."""
+        return nedc_format_text(result)
+
+    def error(self, text):
+        """Print an error of the run, apart from the results."""
+        print(text, file=sys.stderr if self.machine else None)
+
+    def end(self):
+        """Complete the output of a run."""
+#
+# end of class
+
+class JsonlWriter(TextWriter):
+    """Write one line of JSON per file.
+
+    Each line is {"path", "errors", "truncated", "findings"}, and each
+    finding is {"row", "col", "code", "check", "message"}, the NEDC
+    template findings first. truncated is true when the checks of the
+    file stopped at its error limit.
+    """
+
+    machine = True
+
+    def format(self, result):
+        """Return the line written for one file."""
+        return json.dumps({
+            'path': result.filename, 'errors': result.errors,
+            'truncated': result.truncated,
+            'findings': [{'row': finding.row, 'col': finding.col,
+                          'code': finding.code, 'check': finding.check,
+                          'message': finding.get_description()}
+                         for finding in result.nedc + result.findings]},
+            separators=(',', ':')) + '\n'
+#
+# end of class
+
+class SarifWriter(TextWriter):
+    """Write a SARIF log, streaming the results of each file.
+
+    The results array of the run is written first, one file at a time,
+    and the tool object after it, with the rules found during the run,
+    so only the codes seen are kept in memory.
+    """
+
+    machine = True
+
+    def begin(self):
+        """Open the log and the results of its run."""
+        self.rules = {}
+        self.first = True
+        # the relative paths are relative to the current directory
+        self.root = self.uri(os.getcwd()) + '/'
+        self.write_block('{"$schema":%s,"version":%s,"runs":[{"results":[' %
+                         (json.dumps(SARIF_SCHEMA), json.dumps(SARIF_VERSION)))
+
+    def format(self, result):
+        """Return the SARIF results of one file."""
+        parts = []
+        location = {'uri': self.uri(result.filename)}
+        if not os.path.isabs(result.filename):
+            location['uriBaseId'] = SARIF_BASE_ID
+        for finding in result.nedc + result.findings:
+            if finding.code not in self.rules:
+                self.rules[finding.code] = finding.get_description()
+            parts.append(json.dumps({
+                'ruleId': finding.code,
+                'level': 'warning' if finding.code[:1] == 'W' else 'error',
+                'message': {'text': finding.get_description()},
+                'locations': [{'physicalLocation': {
+                    'artifactLocation': location,
+                    'region': {'startLine': finding.row,
+                               'startColumn': finding.col}}}]},
+                separators=(',', ':')))
+        if not parts:
+            return ''
+        text = ('' if self.first else ',') + '\n' + ',\n'.join(parts)
+        self.first = False
+        return text
+
+    def uri(self, path):
+        """Return the URI reference of a path.
+
+        The bytes of the path are percent-encoded, and an absolute path
+        is a file URI.
+        """
+        if not os.path.isabs(path):
+            return urllib.parse.quote(os.fsencode(path.replace(os.sep, '/')))
+        uri = urllib.parse.quote(os.fsencode(path.replace(os.sep, '/')),
+                                 safe='/:')
+        return 'file://' + ('' if uri.startswith('/') else '/') + uri
+
+    def end(self):
+        """Close the results, and write the tool with its rules."""
+        driver = {'name': __FILE__, 'rules': [
+            {'id': code, 'shortDescription': {'text': text}}
+            for code, text in sorted(self.rules.items())]}
+        bases = {SARIF_BASE_ID: {'uri': self.root}}
+        self.write_block(
+            '\n],"tool":{"driver":%s},"originalUriBaseIds":%s}]}\n' %
+            (json.dumps(driver, separators=(',', ':')),
+             json.dumps(bases, separators=(',', ':'))))
+#
+# end of class
+
+class ErrorLimit(Exception):
+    """Stop the checks of a file that reached its error limit."""
+#
+# end of class
+
 class BaseReport:
     """Collect the results of the checks."""
 
@@ -1236,125 +2498,856 @@ class BaseReport:
 # end of class
 
 class StandardReport(BaseReport):
-    """Collect and print the results of the checks."""
+    """Collect the results of the checks in a FileResult per file."""
 
-    def __init__(self, options):
+    def __init__(self):
         super().__init__()
-        self._fmt = REPORT_FORMAT
         self._repeat = True
+        # Rows to report, or None to report the whole file
+        self.rows = None
+        # CodeSelection of the codes to report, or None for all of them
+        self.selection = None
+        # number of errors stopping the checks of a file, or 0
+        self.max_errors = 0
+        self.result = None
 
     
     def init_file(self, filename, lines):
         """Signal a new file."""
-        self._deferred_print = []
+        self.result = FileResult(filename)
         return super().init_file(
             filename, lines)
 
+    def file_error(self, line_number, code, check):
+        """Report a missing NEDC template block."""
+        self.result.nedc.append(Finding(line_number, 1, code, None, check))
+
     def error(self, line_number, offset, text, check):
         """Report an error, according to options."""
+        if self.rows is not None and line_number not in self.rows:
+            return
+        # a check left in the tables reports some codes that are not
+        if self.selection is not None and \
+           not self.selection.is_enabled(text[:4]):
+            return
+        # a file stops on the first error past its limit, so a file with
+        # just as many errors as the limit is complete
+        if self.max_errors and \
+           len(self.result.findings) >= self.max_errors:
+            self.result.truncated = True
+            raise ErrorLimit()
         code = super().error(line_number, offset, text, check)
         if code and (self.counters[code] == 1 or self._repeat):
-            self._deferred_print.append(
-                (line_number, offset, code, text[:]))
+            self.result.findings.append(Finding(
+                self.line_offset + line_number, offset + 1, code, text,
+                check))
         return code
 
     def get_file_results(self):
-        """Print results and return the overall count for this file."""
-        if self._deferred_print:
-            self._deferred_print.sort()
-            for line_number, offset, code, text in self._deferred_print:
-                print(self._fmt % {
-                    'path': self.filename,
-                    'row': self.line_offset + line_number, 'col': offset + 1,
-                    'code': code, 'text': text,
-                })
-                # stdout is block buffered when not stdout.isatty().
-                # line can be broken where buffer boundary since other
-                # processes write to same file.
-                # flush() after print() to avoid buffer boundary.
-                # Typical buffer size is 8192. line written safely when
-                # len(line) < 8192.
-                sys.stdout.flush()
-        else:
-            print("Check Completed. Congratulations, your script has been Isipify!")
-
+        """Complete the result and return the overall count for this file."""
+        self.result.findings.sort()
         return self.file_errors
 #
 # end of class
 
-class FinalReport():
-
-    def __init__(self):
-        # build options from the command line
-        self.checker_class = Checker
-        options = StandardReport
-        self.runner = self.input_file
-        self.options = options
-        self.physical_line_checks = self.get_checks('physical_line')
-        self.logical_line_checks = self.get_checks('logical_line')
-        self.astnedc_checks = self.get_checks('tree')
-        self.init_report()
+class CodeSelection():
+    """Decide which codes are checked, from --select and --ignore.
 
-    def init_report(self):
-        """Initialize the report instance."""
-        self.options.report = (StandardReport)(self.options)
-        return self.options.report
+    Both are lists of code prefixes. A code is enabled when its longest
+    prefix in select is longer than its longest prefix in ignore, so
+    "--ignore E2 --select E225" keeps E225 alone among the E2 codes.
+    Without select, every code matches it with an empty prefix.
+    """
 
-    def check_files(self, path):
-        """Run all checks on the paths."""
-        report = StandardReport
-        runner = self.runner
-        try:
-            with open(path) as f:
-                file = list(f)
-                header = ''.join(file[:])
-                nedc_header_check(header)
-                nedc_gen_import_check(header)
-                nedc_nedc_import_check(header)
-                nedc_global_var_header(header)
-                nedc_function_header(header)
-                nedc_function_define_header(header)
-                nedc_main_function_header(header)
-            runner(path)
-        except KeyboardInterrupt:
-            print('... stopped')
-        return report
+    def __init__(self, select=None, ignore=None):
+        self.select = tuple(select) if select else ('',)
+        self.ignore = tuple(ignore or ())
+        self.enabled = {}
+
+    def __repr__(self):
+        return 'CodeSelection(%r, %r)' % (self.select, self.ignore)
+
+    def is_enabled(self, code):
+        """Return True if the code is selected and not ignored."""
+        enabled = self.enabled.get(code)
+        if enabled is None:
+            selected = max((len(prefix) for prefix in self.select
+                            if code.startswith(prefix)), default=-1)
+            ignored = max((len(prefix) for prefix in self.ignore
+                           if code.startswith(prefix)), default=-1)
+            enabled = self.enabled[code] = selected > ignored
+        return enabled
+#
+# end of class
 
-    def input_file(self, filename, lines=None, expected=None, line_offset=0):
-        """Run all checks on a Python source file."""
-        fchecker = self.checker_class(
-            filename, lines=lines, options= self.options)
-        return fchecker.check_all(expected=expected, line_offset=line_offset)
+class CheckProfile():
+    """Time the checks, and count their calls and errors.
 
-    def get_checks(self, argument_name):
-        """Get all the checks for this category.
+    Profiling is opt-in: the checks are wrapped when the tables of a run
+    are built, so a run without a profile calls them unwrapped and pays
+    nothing for it.
+    """
 
-        Find all globally visible functions where the first argument
-        name starts with argument_name and which contain selected tests.
+    def __init__(self):
+        # name of the check -> [seconds, calls, errors]
+        self.stats = {}
+
+    def wrap(self, name, run, generator=False):
+        """Return run, timed and counted under name."""
+        stats = self.stats.setdefault(name, [0.0, 0, 0])
+        timer = time.perf_counter
+        if generator:
+            # logical checks yield their errors: time the whole iteration
+            def profiled(*args):
+                start = timer()
+                results = list(run(*args) or ())
+                stats[0] += timer() - start
+                stats[1] += 1
+                stats[2] += len(results)
+                return results
+        else:
+            def profiled(*args):
+                start = timer()
+                result = run(*args)
+                stats[0] += timer() - start
+                stats[1] += 1
+                if result is not None:
+                    stats[2] += 1
+                return result
+        profiled.__name__ = name
+        profiled.__doc__ = run.__doc__
+        return profiled
+
+    def pop(self):
+        """Return the statistics so far, and start counting again."""
+        stats = {name: list(values) for name, values in self.stats.items()}
+        for values in self.stats.values():
+            values[:] = [0.0, 0, 0]
+        return stats
+
+    def merge(self, stats):
+        """Add the statistics returned by pop() in another process."""
+        for name, values in stats.items():
+            total = self.stats.setdefault(name, [0.0, 0, 0])
+            for index, value in enumerate(values):
+                total[index] += value
+
+    def print_table(self, output=None, stream=None):
+        """Print the checks sorted by time, and write them to output.
+
+        The table is printed to stream, or to the standard output.
         """
-        checks = []
-        for check, attrs in nedc_checks[argument_name].items():
-            (codes, args) = attrs
-            if any(code for code in codes):
-                checks.append((check.__name__, check, args))
-        return sorted(checks)
+        rows = sorted(((seconds, name, calls, errors)
+                       for name, (seconds, calls, errors)
+                       in self.stats.items()), reverse=True)
+        print('%-40s %10s %8s %12s %12s' %
+              ('check', 'calls', 'errors', 'total (ms)', 'per call (us)'),
+              file=stream)
+        for seconds, name, calls, errors in rows:
+            print('%-40s %10d %8d %12.1f %12.2f' %
+                  (name, calls, errors, seconds * 1e3,
+                   seconds * 1e6 / calls if calls else 0.0), file=stream)
+        if output is not None:
+            with open(output, 'w') as fp:
+                json.dump([{'check': name, 'seconds': seconds,
+                            'calls': calls, 'errors': errors}
+                           for seconds, name, calls, errors in rows],
+                          fp, indent=2)
+                fp.write('\n')
 #
 # end of class
 
-# function: main
-#
-def main(argv):
+class Baseline():
+    """Hold the known violations as a sorted array of 64-bit fingerprints.
 
-    # create a command line parser
-    #
-    cmdl = ncp.Cmdl(USAGE_FILE, HELP_FILE)
-    cmdl.add_argument("files", type = str, nargs = '*')
+    A fingerprint hashes the path of the file, the code of the finding,
+    the normalized logical line it is on and the definitions enclosing
+    that line, but not its row, so it survives the line moving up or
+    down. A fingerprint is stored once per occurrence, and a file only
+    reports the occurrences beyond the count in the baseline. Lookups
+    bisect the array, so a large baseline costs little per finding.
+    """
 
-    # parse the command line
-    #
-    args = cmdl.parse_args()
+    def __init__(self, writing=False):
+        self.writing = writing
+        self.fingerprints = array.array('Q')
+
+    def read(self, path):
+        """Load the fingerprints of a baseline file."""
+        with open(path, 'rb') as fp:
+            if fp.read(len(BASELINE_MAGIC)) != BASELINE_MAGIC:
+                raise ValueError('not a baseline file')
+            data = fp.read()
+        self.fingerprints = array.array('Q')
+        self.fingerprints.frombytes(data)
+        if sys.byteorder == 'big':
+            self.fingerprints.byteswap()
+
+    def write(self, path):
+        """Sort the fingerprints and replace the baseline file with them."""
+        fingerprints = array.array('Q', sorted(self.fingerprints))
+        if sys.byteorder == 'big':
+            fingerprints.byteswap()
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            # a baseline is shared with the sources, not private
+            os.fchmod(fd, 0o644)
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(BASELINE_MAGIC)
+                fingerprints.tofile(fp)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def add(self, fingerprints):
+        """Add the fingerprints of a file to the baseline."""
+        self.fingerprints.extend(fingerprints)
+
+    def count(self, fingerprint):
+        """Return the number of occurrences of a fingerprint."""
+        fingerprints = self.fingerprints
+        return bisect.bisect_right(fingerprints, fingerprint) - \
+            bisect.bisect_left(fingerprints, fingerprint)
+
+    def get_fingerprints(self, result, checker):
+        """Return the fingerprint of each finding of a checked file."""
+        path = os.path.normcase(os.path.relpath(result.filename))
+        starts = checker.logical_starts
+        texts = checker.logical_texts
+        fingerprints = []
+        for finding in result.nedc + result.findings:
+            line = scope = ''
+            if finding.text is not None:
+                index = bisect.bisect_right(starts, finding.row) - 1
+                if index >= 0:
+                    (line, scope) = texts[index]
+            key = '\0'.join((path, finding.code, ' '.join(line.split()),
+                             scope))
+            fingerprints.append(int.from_bytes(hashlib.blake2b(
+                key.encode('utf-8', 'surrogatepass'),
+                digest_size=8).digest(), 'little'))
+        return fingerprints
+
+    def apply(self, result, checker):
+        """Fingerprint the findings of a file, or drop the known ones."""
+        fingerprints = self.get_fingerprints(result, checker)
+        if self.writing:
+            result.fingerprints = fingerprints
+            return
+        seen = {}
+        kept = ([], [])
+        for finding, fingerprint in zip(result.nedc + result.findings,
+                                        fingerprints):
+            seen[fingerprint] = seen.get(fingerprint, 0) + 1
+            if seen[fingerprint] > self.count(fingerprint):
+                kept[finding.text is not None].append(finding)
+        (result.nedc, result.findings) = kept
+#
+# end of class
+
+class ResultCache():
+    """Store the results of the checks on disk, keyed by file content.
+
+    An entry is keyed by the hash of the file content and a fingerprint
+    of the active checks, codes and limits, so changing any is a miss.
+    Entries are written to a temporary file and renamed into place, so
+    processes sharing the directory never read a partial entry. A hit
+    refreshes the modification time of the entry, and prune() evicts the
+    least recently used entries once the directory grows past max_size.
+    """
+
+    def __init__(self, directory, max_size=DEF_CACHE_SIZE << 20,
+                 selection=None):
+        self.directory = directory
+        self.max_size = max_size
+        self.selection = selection
+        os.makedirs(directory, exist_ok=True)
+        self.fingerprint = self.get_fingerprint()
+
+    def get_fingerprint(self):
+        """Hash the checker, its active checks and its limits."""
+        checks = sorted((kind, check.__name__, sorted(codes))
+                        for kind in nedc_checks
+                        for check, (codes, args) in nedc_checks[kind].items())
+        fingerprint = hashlib.blake2b(digest_size=16)
+        fingerprint.update(repr((
+            CACHE_VERSION, checks, MAX_LINE_LENGTH, MAX_DOC_LENGTH,
+            sorted(BLANK_LINES_CONFIG.items()), INDENT_SIZE,
+            self.selection)).encode())
+        with open(__file__, 'rb') as fp:
+            fingerprint.update(fp.read())
+        return fingerprint.hexdigest()
+
+    def get_path(self, digest):
+        """Return the path of the entry for a file content hash."""
+        key = hashlib.blake2b((self.fingerprint + digest).encode(),
+                              digest_size=16).hexdigest()
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, digest):
+        """Return the stored results for a file content hash, or None."""
+        path = self.get_path(digest)
+        try:
+            with open(path, encoding='utf-8') as fp:
+                result = json.load(fp)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return result
+
+    def put(self, digest, result):
+        """Store the results for a file content hash."""
+        path = self.get_path(digest)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path),
+                                       suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+                json.dump(result, fp, separators=(',', ':'))
+            os.replace(tmp, path)
+        except OSError:
+            # A cache that cannot be written only costs a miss later
+            return
+
+    def prune(self):
+        """Evict the least recently used entries beyond max_size."""
+        try:
+            lock = open(os.path.join(self.directory, '.lock'), 'w')
+        except OSError:
+            return
+        with lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return  # another process is already pruning
+            entries = []
+            total = 0
+            for bucket in os.scandir(self.directory):
+                if not bucket.is_dir():
+                    continue
+                for entry in os.scandir(bucket.path):
+                    try:
+                        info = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((info.st_mtime, info.st_size, entry.path))
+                    total += info.st_size
+            if total <= self.max_size:
+                return
+            # evict down to 90% of the limit, so the next runs do not
+            # prune again right away
+            entries.sort()
+            for mtime, size, path in entries:
+                if total <= self.max_size * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+#
+# end of class
+
+class NedcRequestHandler(socketserver.StreamRequestHandler):
+    """Answer one request of a client of the daemon.
+
+    A request is a single line of JSON, either
+    {"paths": [...], "cwd": "...", "include": [...], "exclude": [...]} to
+    check files, lists or directories as the command line would,
+    {"source": "...", "filename": "..."} to check a source sent by the
+    client, or {"reload": true} to reload the checker. The answer is one
+    line of JSON per file, {"path", "nedc", "findings"} with the Findings
+    of its FileResult, or {"error": "..."}, and the connection is closed
+    after the last one. The client formats the results.
+    """
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            return self.send({'error': 'invalid request'})
+        if request.get('reload'):
+            # handled by the daemon itself, this is a forked child
+            os.kill(os.getppid(), signal.SIGHUP)
+            return self.send({'reload': True})
+        if 'source' in request:
+            fname = request.get('filename', 'stdin')
+            source = SourceFile(fname, request['source'])
+            return self.check(fname, source)
+        os.chdir(request.get('cwd', '/'))
+        for fname, source, error in nedc_expand_files(
+                request['paths'], request.get('include'),
+                request.get('exclude', ())):
+            if error is not None:
+                return self.send({'error': error})
+            self.check(fname, source)
+
+    def check(self, fname, source):
+        """Check a file and send its results."""
+        result = self.server.context.check_files(fname, source)
+        self.send({'path': fname, 'nedc': result.nedc,
+                   'findings': result.findings})
+
+    def send(self, result):
+        """Send one line of results to the client."""
+        self.wfile.write(json.dumps(result).encode('utf-8') + b'\n')
+#
+# end of class
+
+class NedcServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """Serve requests on a Unix socket, each in a fork of the daemon.
+
+    The forks start from the warm run context of the daemon, so a request
+    pays neither the interpreter startup nor the setup of the checks, and
+    requests are served concurrently.
+
+    The forks add to the cache of the context, and the daemon prunes it
+    itself: once the forks of the last requests are done, and every
+    DEF_DAEMON_PRUNE requests when it is never idle.
+    """
+
+    def __init__(self, address, context):
+        super().__init__(address, NedcRequestHandler)
+        self.context = context
+        self.timeout = DEF_DAEMON_TIMEOUT
+        # requests served since the cache was last pruned
+        self.unpruned = 0
+
+    def process_request(self, request, client_address):
+        """Fork to serve a request, and count it for the next prune."""
+        super().process_request(request, client_address)
+        self.unpruned += 1
+        if self.unpruned >= DEF_DAEMON_PRUNE:
+            self.prune()
+
+    def handle_timeout(self):
+        """Collect the forks, and prune the cache once requests stop."""
+        super().handle_timeout()
+        # the forks still running have not written their results yet
+        if self.unpruned and not self.active_children:
+            self.prune()
+
+    def prune(self):
+        """Keep the cache of the context within its size."""
+        self.unpruned = 0
+        if self.context.cache is not None:
+            self.context.cache.prune()
+#
+# end of class
+
+class FinalReport():
+    """Hold the state of a whole run of the checker.
+
+    The check tables are built once, Checker instances are reused from
+    one file to the next, and the report collects the totals of the run.
+
+    All the state of a run lives in its instance, and the tables are
+    built from a read-only copy of the registry, so separate instances
+    can run in separate threads. An instance itself is used by one
+    thread at a time.
+    """
+
+    def __init__(self, cache=None, changes=None, profile=None,
+                 selection=None, baseline=None, stream=False,
+                 max_errors=DEF_MAX_ERRORS, fail_fast=False, batch=False,
+                 fused=True):
+        # build options from the command line
+        self.checker_class = Checker
+        # the cache keeps neither the logical lines a fingerprint needs
+        # nor the findings a baseline drops, a streamed file is not read
+        # whole to be hashed, and the errors a limit keeps depend on the
+        # order they are found in, which a cached result has lost
+        self.cache = cache if baseline is None and not stream and \
+            not max_errors else None
+        self.baseline = baseline
+        self.stream = stream
+        self.max_errors = max_errors
+        self.fail_fast = fail_fast
+        self.batch = batch
+        # False runs the fused checks separately, to compare the engines
+        self.fused = fused
+        self.changes = changes
+        self.profile = profile
+        self.selection = selection
+        self.runner = self.input_file
+        # the registry is read once, so the run keeps the same checks
+        self.registry = nedc_checks
+        self.physical_line_checks = self.get_checks('physical_line')
+        self.logical_line_checks = self.get_checks('logical_line')
+        self.astnedc_checks = self.get_checks('tree')
+        self.checks = {
+            'physical_line': self.compile_checks(self.physical_line_checks),
+            'logical_line': self.compile_checks(self.logical_line_checks),
+            'tree': self.compile_checks(self.astnedc_checks)}
+        file_checks = [check for check in NEDC_FILE_CHECKS
+                       if selection is None or selection.is_enabled(
+                           ERRORCODE_REGEX.search(check.__doc__).group())]
+        if profile is not None:
+            file_checks = [profile.wrap(check.__name__, check)
+                           for check in file_checks]
+        # the header check only depends on the rows of the header
+        self.header_checks = tuple(check for check in file_checks
+                                   if check.__name__ == 'nedc_header_check')
+        self.structure_checks = tuple(check for check in file_checks
+                                      if check not in self.header_checks)
+        self.file_checks = self.header_checks + self.structure_checks
+        # Checker instances ready for the next file
+        self.checkers = []
+        self.init_report()
+
+    def init_report(self):
+        """Initialize the report instance of the run."""
+        self.report = StandardReport()
+        self.report.selection = self.selection
+        # a baseline drops findings after the checks: the limit of a file
+        # is then applied to what is left
+        if self.baseline is None:
+            self.report.max_errors = self.max_errors
+        return self.report
+
+    def get_totals(self):
+        """Return the counters of all the files checked so far."""
+        totals = dict(self.report.counters)
+        totals['errors'] = self.report.total_errors
+        return totals
+
+    def check_files(self, path, source=None):
+        """Run all checks on the paths and return their FileResult."""
+        report = self.report
+        runner = self.runner
+        changes = None
+        if self.changes is not None:
+            changes = self.changes[path]
+        try:
+            if source is None and self.stream:
+                return self.check_stream(path)
+            if source is None:
+                source = SourceFile(path)
+            suppressed = nedc_file_suppression(source.text)
+            if suppressed == ('',):
+                return self.skip(path, source.lines)
+            if changes is not None:
+                # only report the errors found in the changed rows
+                report.rows = changes['rows']
+                self.check_changes(path, source, changes, suppressed)
+                return report.result
+            if self.cache is not None:
+                cached = self.cache.get(source.digest)
+                if cached is not None:
+                    self.replay(path, source, cached)
+                    return report.result
+            counters = report.counters
+            logical_lines = counters['logical lines']
+            runner(path, lines=source.lines, suppressed=suppressed)
+            if self.cache is not None:
+                self.cache.put(source.digest, {
+                    'nedc': report.result.nedc,
+                    'errors': report.result.findings,
+                    'logical lines': counters['logical lines'] - logical_lines,
+                })
+        except KeyboardInterrupt:
+            print('... stopped')
+        finally:
+            report.rows = None
+        return report.result
+
+    def check_source(self, filename, source):
+        """Run all checks on a source held in memory.
+
+        source is a SourceFile, a string, bytes or a list of lines. The
+        FileResult is returned, and neither the cache nor the disk is
+        used.
+        """
+        if isinstance(source, list):
+            source = ''.join(source)
+        if not isinstance(source, SourceFile):
+            source = SourceFile(filename, source)
+        suppressed = nedc_file_suppression(source.text)
+        if suppressed == ('',):
+            return self.skip(filename, source.lines)
+        self.runner(filename, lines=source.lines, suppressed=suppressed)
+        return self.report.result
+
+    def check_stream(self, path):
+        """Run all checks on a file read one line at a time.
+
+        Only the lines of the logical line being checked are kept, so
+        a file of any size is checked in the same memory. The tree is
+        not built, and the NEDC checks find the definitions on the
+        lines alone.
+        """
+        with LineStream(path) as lines:
+            if lines.suppressed == ('',):
+                return self.skip(path, lines)
+            self.runner(path, lines=lines, suppressed=lines.suppressed)
+        return self.report.result
+
+    def skip(self, path, lines):
+        """Report a file suppressed as a whole, without tokenizing it."""
+        report = self.report
+        report.init_file(path, lines)
+        report.get_file_results()
+        return report.result
+
+    def check_changes(self, path, source, changes, suppressed=()):
+        """Run the checks whose results can depend on the changed rows.
+
+        The file header is only checked when a change falls in its rows,
+        and the other NEDC file checks when a changed or removed line
+        could be part of a comment block, an import or a definition.
+        """
+        checks = []
+        if min(changes['rows']) <= nedc_header_rows(source.lines):
+            checks.extend(self.header_checks)
+        if changes['structure']:
+            checks.extend(self.structure_checks)
+        return self.runner(path, lines=source.lines, file_checks=checks,
+                           suppressed=suppressed)
+
+    def replay(self, path, source, cached):
+        """Report the cached results of a file without checking it."""
+        report = self.report
+        report.init_file(path, source.lines)
+        for row, col, code, text, check in cached['nedc']:
+            report.file_error(row, code, check)
+        report.counters['logical lines'] += cached['logical lines']
+        for row, col, code, text, check in cached['errors']:
+            report.error(row, col - 1, text, check)
+        return report.get_file_results()
+
+    def input_file(self, filename, lines=None, expected=None, line_offset=0,
+                   file_checks=None, suppressed=()):
+        """Run all checks on a Python source file."""
+        if file_checks is None:
+            file_checks = self.file_checks
+        if self.checkers:
+            fchecker = self.checkers.pop()
+        else:
+            fchecker = self.checker_class(report=self.report,
+                                          checks=self.checks,
+                                          profile=self.profile,
+                                          registry=self.registry,
+                                          batch=self.batch,
+                                          fused=self.fused)
+            fchecker.record_logical = self.baseline is not None
+        try:
+            fchecker.init_file(filename, lines, file_checks, suppressed)
+            try:
+                errors = fchecker.check_all(expected=expected,
+                                            line_offset=line_offset)
+            except ErrorLimit:
+                # the file failed enough: skip the rest of its line
+                # checks, but still scan it for the NEDC template
+                if fchecker.scanner is not None:
+                    fchecker.check_file()
+                errors = self.report.get_file_results()
+            if self.baseline is not None:
+                result = self.report.result
+                self.baseline.apply(result, fchecker)
+                if self.max_errors and len(result.findings) > \
+                        self.max_errors:
+                    del result.findings[self.max_errors:]
+                    result.truncated = True
+            return errors
+        finally:
+            self.checkers.append(fchecker)
+
+    def compile_checks(self, checks):
+        """Compile the checks returned by get_checks to run them.
+
+        Each check comes with a function calling it on a Checker, built
+        once by nedc_compile_check, and timed when the run is profiled.
+        The fused checks share one scan of the logical line instead, and
+        the plan of the scan times it and them apart.
+        """
+        plan = nedc_fuse_checks(checks, self.profile) if self.fused else None
+        compiled = []
+        for name, check, args in checks:
+            if args is None:
+                # a tree check is called by the walk, on its visit methods
+                compiled.append((name, check, nedc_compile_tree_check(check)))
+                continue
+            if plan is not None and check in FUSED_LOGICAL_CHECKS:
+                compiled.append((name, check,
+                                 nedc_compile_fused_check(name, plan)))
+                continue
+            run = nedc_compile_check(name, check, args)
+            if self.profile is not None:
+                run = self.profile.wrap(
+                    name, run, inspect.isgeneratorfunction(check))
+            compiled.append((name, check, run))
+        return compiled
+
+    def get_checks(self, argument_name):
+        """Get all the checks for this category.
+
+        Find all globally visible functions where the first argument
+        name starts with argument_name and which contain selected tests.
+        The checks whose codes are all disabled are left out of the
+        tables, so they cost nothing on each line.
+        """
+        selection = self.selection
+        checks = []
+        for check, attrs in self.registry[argument_name].items():
+            (codes, args) = attrs
+            if any(code and (selection is None or selection.is_enabled(code))
+                   for code in codes):
+                checks.append((check.__name__, check, args))
+        return sorted(checks)
+#
+# end of class
+
+#------------------------------------------------------------------------------
+#
+# format functions are listed here
+#
+#------------------------------------------------------------------------------
+
+# function: nedc_format_text
+#
+# argument:
+#   result: the FileResult of a file
+#
+# return: the text printed for the file
+#
+# this function formats the findings of a file as the checker prints
+# them: the missing NEDC template blocks first, then one line per error,
+# or a message of congratulations when there is none.
+#
+def nedc_format_text(result):
+
+    parts = [finding.get_message() + '\n' for finding in result.nedc]
+    if result.findings:
+        path = result.filename
+        for finding in result.findings:
+            parts.append(REPORT_FORMAT % {
+                'path': path, 'row': finding.row, 'col': finding.col,
+                'code': finding.code, 'text': finding.text} + '\n')
+    else:
+        parts.append(NEDC_CLEAN_MESSAGE + '\n')
+    if result.truncated:
+        parts.append(TRUNCATED_FORMAT % {
+            'path': result.filename, 'count': result.errors} + '\n')
+    return ''.join(parts)
+
+#------------------------------------------------------------------------------
+#
+# run functions are listed here
+#
+#------------------------------------------------------------------------------
+
+# function: nedc_walk_matches
+#
+# argument:
+#   name: the name of a directory entry
+#   rpath: its path relative to the directory walked
+#   patterns: a list of glob patterns
+#
+# return: a boolean value indicating if a pattern matches the entry
+#
+# this function matches the patterns against both the name and the
+# relative path of an entry, so "build" and "src/*/test_*.py" both work
+#
+def nedc_walk_matches(name, rpath, patterns):
+    for pattern in patterns:
+        if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(rpath, pattern):
+            return True
+    return False
+
+# function: nedc_sniff_python
+#
+# argument:
+#   path: the path of a file without extension
+#
+# return: a boolean value indicating if the file starts with a python
+#  shebang
+#
+# this function reads only the first bytes of the file, so binary files
+# and large data files cost one small read
+#
+def nedc_sniff_python(path):
+    try:
+        with open(path, 'rb') as fp:
+            header = fp.read(DEF_SHEBANG_SIZE)
+    except OSError:
+        return False
+    return header.startswith(b'#!') and \
+        DEF_PYTHON_HEADER.encode() in header.split(b'\n', 1)[0]
+
+# function: nedc_walk_files
+#
+# argument:
+#   top: the directory to walk
+#   include: glob patterns a script must match, or None for all
+#   exclude: glob patterns of the files and directories to skip
+#
+# return: a generator of the python scripts found under top
+#
+# this function walks the tree depth first, in sorted order, with
+# os.scandir. a script is recognized by its extension first, and files
+# without extension by their shebang. excluded directories are pruned
+# before they are opened, and unreadable ones are skipped like os.walk
+# does. symbolic links to directories are not followed.
+#
+def nedc_walk_files(top, include=None, exclude=()):
+
+    exclude = DEF_WALK_EXCLUDE + list(exclude or ())
+    stack = [(top, '')]
+    while stack:
+        path, rpath = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        subdirs = []
+        for entry in entries:
+            rname = rpath + entry.name
+            if nedc_walk_matches(entry.name, rname, exclude):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append((entry.path, rname + os.sep))
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            if include and \
+               not nedc_walk_matches(entry.name, rname, include):
+                continue
+            ext = os.path.splitext(entry.name)[1]
+            if ext == DEF_PYTHON_EXTENSION or \
+               (not ext and nedc_sniff_python(entry.path)):
+                yield entry.path
+
+        # visit the subdirectories in order, after the files
+        #
+        stack.extend(reversed(subdirs))
+
+# function: nedc_expand_files
+#
+# argument:
+#   fnames: python scripts, lists of python scripts or directories
+#   include: glob patterns the scripts found in directories must match
+#   exclude: glob patterns of the files and directories to skip
+#   stream: True to recognize the scripts without reading them whole
+#
+# return: a generator of (filename, source, error) triples
+#
+# this function expands the lists and the directories and yields each
+# script in command line order, as soon as it is found. source is the
+# SourceFile of a script that had to be read to recognize it, or None.
+# error is None for a valid script, or the message to print before
+# stopping the run.
+#
+def nedc_expand_files(fnames, include=None, exclude=(), stream=False):
 
-    for fname in args.files:
+    for fname in fnames:
 
         # expand the file filename (checking for environment variables)
         #
@@ -1363,49 +3356,1017 @@ def main(argv):
         # check if the file exists
         #
         if os.path.exists(ffile) is False:
-            print("Error: %s (line: %s) %s: file does not exist (%s)" %
-                  (__FILE__, ndt.__LINE__, ndt.__NAME__, fname))
-            sys.exit(os.EX_SOFTWARE)
+            yield fname, None, \
+                ("Error: %s (line: %s) %s: file does not exist (%s)" %
+                 (__FILE__, ndt.__LINE__, ndt.__NAME__, fname))
+            return
 
-        # case (1): a python script
+        # case (1): a directory, walked while the scripts are checked.
+        # the scripts are named from the argument, as the scripts given
+        # one by one are, so a relative argument gives relative paths
         #
-        if (is_python(fname)):
-
-            # run the checker on the file
-            #
-            FinalReport().check_files(fname)
+        if os.path.isdir(ffile):
+            top = os.path.expanduser(os.path.expandvars(fname))
+            for file in nedc_walk_files(top, include, exclude):
+                yield file, None, None
+            continue
 
-        # case (2): a list
+        # case (2): a python script, read once for both the test and
+        # the checker, unless it is streamed: then only its first line
+        # is read here
         #
+        if stream:
+            with open(ffile, 'rb') as fp:
+                header = fp.readline(DEF_SHEBANG_SIZE)
+            if DEF_PYTHON_HEADER.encode() in header:
+                yield fname, None, None
+                continue
         else:
+            source = SourceFile(ffile)
+            if (is_python(fname, source)):
+                yield fname, source, None
+                continue
+
+        # case (3): a list
+        #
+        files = nft.get_flist(ffile)
+        if files is None:
+            yield fname, None, \
+                ("Error: %s (line: %s) %s: error opening (%s)" %
+                 (__FILE__, ndt.__LINE__, ndt.__NAME__, fname))
+            return
+
+        for file in files:
 
-            # fetch the list
+            # expand the filename (checking for environment variables)
             #
-            files = nft.get_flist(ffile)
-            if files is None:
-                print("Error: %s (line: %s) %s: error opening (%s)" %
-                      (__FILE__, ndt.__LINE__, ndt.__NAME__, fname))
-                sys.exit(os.EX_SOFTWARE)
+            ffile = nft.get_fullpath(file)
+
+            # check if the file exists
+            #
+            if os.path.exists(ffile) is False:
+                yield file, None, ("Error: %s (line: %s) %s: %s (%s)" %
+                                   (__FILE__, ndt.__LINE__, ndt.__NAME__,
+                                    "file does not exist", fname))
+                return
+
+            yield file, None, None
+
+# function: nedc_git_path
+#
+# argument:
+#   text: the path of a '+++ ' line of a git diff
+#
+# return: the path of the file
+#
+# this function undoes what git does to a path in a diff header: a path
+# with a space ends with a tab, and a path with a quote, a backslash or a
+# control character (or any non-ascii character, unless core.quotePath
+# is false) is quoted as a C string, with its other bytes in octal
+#
+def nedc_git_path(text):
+    if text.endswith('\t'):
+        text = text[:-1]
+    if len(text) < 2 or text[0] != '"' or text[-1] != '"':
+        return text
+
+    # unquote the bytes, and decode them as the diff was
+    #
+    quoted = text[1:-1].encode('utf-8', 'surrogateescape')
+    path = bytearray()
+    index = 0
+    while index < len(quoted):
+        byte = quoted[index:index + 1]
+        index += 1
+        if byte != b'\\':
+            path += byte
+            continue
+        escape = quoted[index:index + 1]
+        if escape.isdigit():
+            path.append(int(quoted[index:index + 3], 8))
+            index += 3
+        else:
+            path += GIT_ESCAPES.get(escape, escape)
+            index += 1
+    return path.decode('utf-8', 'surrogateescape')
+
+# function: nedc_git_changes
+#
+# argument:
+#   rev: the git revision to compare the working tree with
+#
+# return: a dictionary mapping each changed file to its changes
+#
+# this function asks git for the files changed since rev. the changes of
+# a file are the set of rows added or modified in it ('rows'), and whether
+# a changed or removed line could affect the NEDC file checks
+# ('structure').
+#
+def nedc_git_changes(rev):
 
+    # find the top of the work tree, the paths in the diff are relative to
+    # it. the diff is read as bytes: a changed file that is not utf-8,
+    # python or not, must not stop the run, and its bytes are kept as
+    # they are by surrogateescape, as the paths of the os module are
+    #
+    try:
+        top = subprocess.run(['git', 'rev-parse', '--show-toplevel'],
+                             capture_output=True, check=True)
+        top = top.stdout.decode('utf-8', 'surrogateescape').rstrip('\n')
+        diff = subprocess.run(GIT_DIFF + [rev, '--'], capture_output=True,
+                              check=True, cwd=top)
+    except (OSError, subprocess.CalledProcessError) as e:
+        error = getattr(e, 'stderr', None)
+        if error:
+            error = error.decode('utf-8', 'replace')
+        print("Error: %s (line: %s) %s: git diff failed (%s)" %
+              (__FILE__, ndt.__LINE__, ndt.__NAME__,
+               (error or str(e)).strip()))
+        sys.exit(os.EX_SOFTWARE)
+
+    changes = {}
+    file = None
+    in_hunk = False
+    for line in diff.stdout.decode('utf-8', 'surrogateescape').splitlines():
+        if line.startswith('diff --git '):
+            file = None
+            in_hunk = False
+        elif not in_hunk and line.startswith('+++ '):
+            fname = os.path.relpath(os.path.join(top,
+                                                 nedc_git_path(line[4:])))
+            file = changes[fname] = {'rows': set(), 'structure': False}
+        elif line.startswith('@@') and file is not None:
+            in_hunk = True
+            match = NEDC_HUNK_REGEX.match(line)
+            start = int(match.group(1))
+            count = int(match.group(2) or 1)
+            if count:
+                file['rows'].update(range(start, start + count))
             else:
+                # lines removed after row start: the next row may now be
+                # in error (blank lines, for instance)
+                file['rows'].update((start, start + 1))
+        elif in_hunk and line[:1] in '+-':
+            if NEDC_STRUCTURE_REGEX.search(line[1:]):
+                file['structure'] = True
+
+    # files without hunks (a mode change) have nothing to report
+    #
+    return {fname: file for fname, file in changes.items() if file['rows']}
 
-                for file in files:
+# function: nedc_diff_files
+#
+# argument:
+#   changes: a dictionary returned by nedc_git_changes
+#
+# return: a generator of (filename, source, error) triples
+#
+# this function yields the changed files that are python scripts
+#
+def nedc_diff_files(changes):
+    for fname in changes:
+        if fname.endswith('.py'):
+            yield fname, None, None
+            continue
 
-                    # expand the filename (checking for environment variables)
-                    #
-                    ffile = nft.get_fullpath(file)
+        # any other changed file may be binary, or not utf-8
+        #
+        try:
+            python = is_python(fname)
+        except (OSError, UnicodeError):
+            python = False
+        if python:
+            yield fname, None, None
+
+# function: nedc_serve
+#
+# argument:
+#   address: the path of the Unix socket to listen on
+#   cache: the ResultCache shared by the run, or None
+#   selection: the CodeSelection of the codes to check, or None for all
+#
+# return: none
+#
+# this function runs the checker as a daemon until it is stopped. on
+# SIGHUP, or a reload request, the daemon execs itself again, so the
+# checker and its check registry are reloaded from the disk.
+#
+def nedc_serve(address, cache=None, selection=None):
+
+    # replace the socket left by a daemon that did not exit cleanly
+    #
+    try:
+        if stat.S_ISSOCK(os.stat(address).st_mode):
+            os.remove(address)
+    except FileNotFoundError:
+        pass
+
+    reload = []
+    signal.signal(signal.SIGHUP, lambda signum, frame: reload.append(signum))
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    context = FinalReport(cache, selection=selection)
+
+    # only the owner may connect: the socket is created without access
+    # for the others, instead of being restricted once it is listening
+    #
+    umask = os.umask(0o077)
+    try:
+        server = NedcServer(address, context)
+    finally:
+        os.umask(umask)
+
+    # warm up the checker before forking, the forks start from its state
+    #
+    nedc_format_text(server.context.check_files('warmup', SourceFile(
+        'warmup', NEDC_FILE_HEADER_STRING + NEDC_MAIN_FUNCTION_STRING +
+        'def main(argv):\n    return  1+2\n')))
+    try:
+        os.chmod(address, stat.S_IRUSR | stat.S_IWUSR)
+        while not reload:
+            server.handle_request()
+    finally:
+        server.server_close()
+        os.remove(address)
+
+    # start a new daemon, listening on the same socket
+    #
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+# function: nedc_client
+#
+# argument:
+#   address: the path of the Unix socket of the daemon
+#   fnames: python scripts or lists, or ['-'] to send the standard input
+#   reload: True to ask the daemon to reload instead
+#   include: glob patterns the scripts found in directories must match
+#   exclude: glob patterns of the files and directories to skip
+#   writer: the writer of the results, or None to print them as text
+#
+# return: the number of errors found
+#
+# this function sends a request to a daemon and writes its results as a
+# run of the checker would
+#
+def nedc_client(address, fnames, reload=False, include=None, exclude=(),
+                writer=None):
 
-                    # check if the file exists
-                    #
-                    if os.path.exists(ffile) is False:
-                        print("Error: %s (line: %s) %s: %s (%s)" %
-                              (__FILE__, ndt.__LINE__, ndt.__NAME__,
-                               "file does not exist", fname))
+    if writer is None:
+        writer = TextWriter()
+
+    if reload:
+        request = {'reload': True}
+    elif fnames == ['-']:
+        request = {'source': sys.stdin.read(), 'filename': 'stdin'}
+    else:
+        request = {'paths': fnames, 'cwd': os.getcwd(), 'include': include,
+                   'exclude': list(exclude)}
+
+    errors = 0
+    writer.begin()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(address)
+            sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            with sock.makefile('r', encoding='utf-8') as fp:
+                for line in fp:
+                    result = json.loads(line)
+                    if 'error' in result:
+                        writer.error(result['error'])
                         sys.exit(os.EX_SOFTWARE)
-                    
-                    # run the checker on the file
-                    #
-                    FinalReport().check_files(file)
+                    if 'path' in result:
+                        file_result = FileResult(result['path'])
+                        file_result.nedc = [Finding(*finding) for finding
+                                            in result['nedc']]
+                        file_result.findings = [Finding(*finding) for finding
+                                                in result['findings']]
+                        writer.write(file_result)
+                        errors += file_result.errors
+    except OSError as e:
+        print("Error: %s (line: %s) %s: cannot reach the daemon (%s)" %
+              (__FILE__, ndt.__LINE__, ndt.__NAME__, e))
+        sys.exit(os.EX_SOFTWARE)
+    writer.end()
+    return errors
+
+# function: nedc_check_serial
+#
+# argument:
+#   files: a generator of (filename, source, error) triples
+#   cache: the ResultCache shared by the run, or None
+#   changes: the changes of each file in incremental mode, or None
+#   profile: the CheckProfile of the run, or None
+#   writer: the writer of the results, or None to print them as text
+#   selection: the CodeSelection of the codes to check, or None for all
+#   baseline: the Baseline to check against or to write, or None
+#   stream: True to read each script one line at a time
+#   max_errors: the number of errors stopping the checks of a file, or 0
+#   fail_fast: True to stop the run at the first file with a finding
+#   batch: True to run the batch physical pass on each script
+#
+# return: the totals of the run, with 'stopped' set when the run stopped
+#  at a failing file
+#
+# this function checks each script in the current process, with a single
+# run context
+#
+def nedc_check_serial(files, cache=None, changes=None, profile=None,
+                      writer=None, selection=None, baseline=None,
+                      stream=False, max_errors=DEF_MAX_ERRORS,
+                      fail_fast=False, batch=False):
+
+    if writer is None:
+        writer = TextWriter()
+    context = FinalReport(cache, changes, profile, selection, baseline,
+                          stream, max_errors, fail_fast, batch)
+    stopped = False
+    writer.begin()
+    for fname, source, error in files:
+        if error is not None:
+            writer.error(error)
+            sys.exit(os.EX_SOFTWARE)
+
+        # run the checker on the file and write its results
+        #
+        result = context.check_files(fname, source)
+        writer.write(result)
+        if result.fingerprints is not None:
+            baseline.add(result.fingerprints)
+
+        # stop at the first failing file when asked to
+        #
+        if fail_fast and result.failed:
+            stopped = True
+            break
+
+    writer.end()
+    totals = context.get_totals()
+    totals['stopped'] = stopped
+    return totals
+
+# function: nedc_worker_init
+#
+# argument:
+#   cache: the ResultCache shared by the run, or None
+#   changes: the changes of each file in incremental mode, or None
+#   profile: an empty CheckProfile to profile the worker, or None
+#   selection: the CodeSelection of the codes to check, or None for all
+#   baseline: the Baseline to check against or to write, or None
+#   stream: True to read each script one line at a time
+#   max_errors: the number of errors stopping the checks of a file, or 0
+#   fail_fast: True to stop a chunk at its first file with a finding
+#   batch: True to run the batch physical pass on each script
+#
+# return: none
+#
+# this function builds the checker a worker keeps for its whole life
+#
+def nedc_worker_init(cache=None, changes=None, profile=None, selection=None,
+                     baseline=None, stream=False, max_errors=DEF_MAX_ERRORS,
+                     fail_fast=False, batch=False):
+    global nedc_worker
+    nedc_worker = FinalReport(cache, changes, profile, selection, baseline,
+                              stream, max_errors, fail_fast, batch)
+
+# function: nedc_worker_check
+#
+# argument:
+#   fnames: a chunk of python scripts
+#
+# return: the FileResult of each script, the totals of the chunk and its
+#  profile (or None)
+#
+# this function runs the checker of a worker on each script. the results
+# are formatted by the parent, so the workers do no string work for the
+# output
+#
+def nedc_worker_check(fnames):
+    before = nedc_worker.get_totals()
+    results = []
+    for fname in fnames:
+        results.append(nedc_worker.check_files(fname))
+        # the run stops at this file: the rest of the chunk is not needed
+        if nedc_worker.fail_fast and results[-1].failed:
+            break
+    totals = {key: count - before.get(key, 0)
+              for key, count in nedc_worker.get_totals().items()}
+    stats = None
+    if nedc_worker.profile is not None:
+        stats = nedc_worker.profile.pop()
+    return results, totals, stats
+
+# function: nedc_check_parallel
+#
+# argument:
+#   files: a generator of (filename, source, error) triples
+#   jobs: the number of worker processes
+#   cache: the ResultCache shared by the run, or None
+#   changes: the changes of each file in incremental mode, or None
+#   profile: the CheckProfile of the run, or None
+#   writer: the writer of the results, or None to print them as text
+#   selection: the CodeSelection of the codes to check, or None for all
+#   baseline: the Baseline to check against or to write, or None
+#   stream: True to read each script one line at a time
+#   max_errors: the number of errors stopping the checks of a file, or 0
+#   fail_fast: True to stop the run at the first file with a finding
+#   batch: True to run the batch physical pass on each script
+#
+# return: the totals of the run, with 'stopped' set when the run stopped
+#  at a failing file
+#
+# this function sends chunks of scripts to a pool of workers and prints
+# their results in input order, so the output matches a serial run. only a
+# few chunks per worker are pending at once, so the memory does not grow
+# with the length of the list.
+#
+def nedc_check_parallel(files, jobs, cache=None, changes=None, profile=None,
+                        writer=None, selection=None, baseline=None,
+                        stream=False, max_errors=DEF_MAX_ERRORS,
+                        fail_fast=False, batch=False):
+
+    def flush(pending, limit):
+        while len(pending) > limit and not totals['stopped']:
+            results, chunk_totals, stats = pending.popleft().get()
+            if stats is not None:
+                profile.merge(stats)
+            if fail_fast:
+                # keep the results up to the first failing file
+                for index, result in enumerate(results):
+                    if result.failed:
+                        del results[index + 1:]
+                        totals['stopped'] = True
+                        break
+            writer.write_all(results)
+            for result in results:
+                if result.fingerprints is not None:
+                    baseline.add(result.fingerprints)
+            for key, count in chunk_totals.items():
+                totals[key] = totals.get(key, 0) + count
+
+    if writer is None:
+        writer = TextWriter()
+    totals = dict.fromkeys(BENCHMARK_KEYS, 0)
+    totals['errors'] = 0
+    totals['stopped'] = False
+    pending = collections.deque()
+    writer.begin()
+    chunk = []
+    with multiprocessing.Pool(jobs, initializer=nedc_worker_init,
+                              initargs=(cache, changes, profile,
+                                        selection, baseline, stream,
+                                        max_errors, fail_fast,
+                                        batch)) as pool:
+        for fname, source, error in files:
+            if error is not None:
+                if chunk:
+                    pending.append(pool.apply_async(nedc_worker_check,
+                                                    (chunk,)))
+                flush(pending, 0)
+                writer.error(error)
+                sys.exit(os.EX_SOFTWARE)
+
+            chunk.append(fname)
+            if len(chunk) == DEF_POOL_CHUNK:
+                pending.append(pool.apply_async(nedc_worker_check, (chunk,)))
+                chunk = []
+                flush(pending, jobs * DEF_POOL_WINDOW)
+                if totals['stopped']:
+                    break
+
+        if chunk and not totals['stopped']:
+            pending.append(pool.apply_async(nedc_worker_check, (chunk,)))
+        flush(pending, 0)
+
+    # leaving the pool terminated the workers still busy with chunks
+    # whose results are not needed, after a failing file
+    #
+    writer.end()
+    return totals
+
+#------------------------------------------------------------------------------
+#
+# api functions are listed here
+#
+#------------------------------------------------------------------------------
+
+# function: nedc_check_source
+#
+# argument:
+#   source: the source to check, as a string, bytes or a list of lines
+#   filename: the name to give the source in the results
+#
+# return: the FileResult of the source
+#
+# this function checks a source held in memory, without touching the
+# disk, and returns its results instead of printing them. the nedc
+# attribute of the result holds the Findings of the missing NEDC
+# template blocks, and findings those of the physical and logical line
+# checks, sorted by position.
+#
+def nedc_check_source(source, filename='stdin'):
+    return nedc_check_sources([(filename, source)])[0]
+
+# function: nedc_check_sources
+#
+# argument:
+#   sources: an iterable of (filename, source) pairs
+#
+# return: a list with the results of each source, in order
+#
+# this function checks many sources held in memory in one call. the run
+# context is built on the first call of a thread and reused by its next
+# calls, so this function, and nedc_check_source, can be called from
+# many threads at once.
+#
+def nedc_check_sources(sources):
+    context = getattr(nedc_api, 'context', None)
+    if context is None:
+        context = nedc_api.context = FinalReport()
+    return [context.check_source(filename, source)
+            for filename, source in sources]
+
+# function: nedc_check_threads
+#
+# argument:
+#   sources: a list of (filename, source) pairs
+#   threads: the number of threads to check them with
+#
+# return: a list with the results of each source, in order
+#
+# this function checks many sources held in memory with a pool of
+# threads in this process, instead of sending them to worker processes.
+# each thread checks with its own run context, so the checks only run in
+# parallel on an interpreter without a global lock (free-threaded).
+#
+def nedc_check_threads(sources, threads=DEF_JOBS):
+    if threads <= 1:
+        return nedc_check_sources(sources)
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+        return list(pool.map(nedc_check_source,
+                             [source for filename, source in sources],
+                             [filename for filename, source in sources]))
+
+#------------------------------------------------------------------------------
+#
+# benchmark functions are listed here
+#
+#------------------------------------------------------------------------------
+
+# function: nedc_bench_function
+#
+# argument:
+#   name: the name of the function
+#   body: the lines of its body, without indentation
+#
+# return: the text of a function with its NEDC header
+#
+# this function writes a function the way the NEDC template asks for
+#
+def nedc_bench_function(name, body):
+    lines = ['# function: %s\n' % name, '#\n', '# argument:\n',
+             '#   value: an integer\n', '#\n', '# return: an integer\n',
+             '#\n', 'def %s(value):\n' % name]
+    lines.extend('    %s\n' % line for line in body)
+    return ''.join(lines) + '\n'
+
+# function: nedc_bench_source
+#
+# argument:
+#   shape: one of BENCH_SHAPES
+#   size: the size of the file, in functions or blocks
+#   rng: a random.Random generator
+#
+# return: the text of a generated python script
+#
+# this function generates an NEDC-style script whose content stresses one
+# part of the checker:
+#  compliant: small functions that follow the template
+#  functions: many functions, with a few style errors
+#  long_lines: lines longer than MAX_LINE_LENGTH
+#  nesting: deeply nested blocks
+#  docstrings: functions with very long docstrings
+#
+def nedc_bench_source(shape, size, rng):
+
+    # every file starts with the NEDC template
+    #
+    parts = [NEDC_FILE_HEADER_STRING.replace(
+        'path/to/script/~.py', 'bench/nedc_%s.py' % shape).replace(
+        'yyyymmdd ([initial firstname][initial lastname])',
+        '20211121 (PM)'), '\n', NEDC_GENERAL_IMPORT_STRING,
+        'import os\nimport sys\n\n', NEDC_NEDC_IMPORT_STRING,
+        'import nedc_file_tools as nft\n\n',
+        NEDC_GLOBAL_VARIABLE_COMMENT_STRING, '\nLIMIT = %d\n\n' % size,
+        NEDC_FUNCTION_COMMENT_STRING, '\n']
+
+    for index in range(size):
+        name = 'function_%d' % index
+        if shape == 'compliant':
+            body = ['total = value + %d' % rng.randint(0, 99),
+                    'return total * LIMIT']
+        elif shape == 'functions':
+            body = ['return value+%d' % index]
+            for extra in range(rng.randint(0, 3)):
+                name_ = '%s_%d' % (name, extra)
+                parts.append(nedc_bench_function(
+                    name_, ['items = [value,%d]' % extra, 'return items']))
+        elif shape == 'long_lines':
+            terms = ' + '.join('value * %d' % rng.randint(100, 999)
+                               for term in range(rng.randint(8, 30)))
+            body = ['total = %s' % terms,
+                    '# see https://isip.piconepress.com/%s' % ('x' * 90),
+                    'return total']
+        elif shape == 'nesting':
+            body = []
+            for depth in range(rng.randint(5, 20)):
+                body.append('    ' * depth + 'if value > %d:' % depth)
+            body.append('    ' * (depth + 1) + 'value  = value - 1')
+            body.append('return value')
+        elif shape == 'docstrings':
+            body = ['"""'] + ['%s line %d of a very long docstring.' %
+                              (name, line)
+                              for line in range(rng.randint(50, 200))]
+            body += ['"""', 'return value']
+        else:
+            raise ValueError('unknown benchmark shape: %s' % shape)
+        parts.append(nedc_bench_function(name, body))
+
+    parts.append(NEDC_MAIN_FUNCTION_STRING)
+    parts.append('def main(argv):\n    return function_0(LIMIT)\n\n')
+    parts.append("if __name__ == '__main__':\n    main(sys.argv[0:])\n\n")
+    parts.append('#\n# end of file\n')
+    return ''.join(parts)
+
+# function: nedc_bench_rss
+#
+# argument: none
+#
+# return: the peak resident set size of the process, in MB, or None
+#
+# this function reads the peak memory use of the benchmark
+#
+def nedc_bench_rss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in kilobytes elsewhere
+    #
+    if sys.platform == 'darwin':
+        return rss / (1 << 20)
+    return rss / (1 << 10)
+
+# function: nedc_benchmark
+#
+# argument:
+#   shapes: the shapes of file to generate (see nedc_bench_source)
+#   nfiles: the number of files per shape
+#   size: the size of each file
+#   seed: the seed of the generator, so corpora are reproducible
+#   output: the path of the JSON file to write the results to, or None
+#   threads: the number of threads of the stress run, or 0 for none
+#   engines: True to compare the fused and separate logical checks
+#
+# return: the results, one dictionary per shape
+#
+# this function generates a corpus for each shape in a temporary
+# directory, runs the whole FinalReport.check_files pipeline on it and
+# reports the throughput of the checker. with threads, the corpus is
+# checked again by that many threads at once, and the results must be
+# the same as the ones of the serial run. with engines, it is checked
+# once more with each engine of FUSED_LOGICAL_CHECKS, profiled to time
+# these checks and the fused scan alone, and both must find the same
+# errors.
+#
+def nedc_benchmark(shapes, nfiles, size, seed=DEF_BENCH_SEED, output=None,
+                   threads=0, engines=False):
+
+    rng = random.Random(seed)
+    results = []
+    with tempfile.TemporaryDirectory(prefix='nedc_bench_') as directory:
+        for shape in shapes:
+
+            # generate the corpus
+            #
+            fnames = []
+            for index in range(nfiles):
+                fname = os.path.join(directory, '%s_%d.py' % (shape, index))
+                with open(fname, 'w') as fp:
+                    fp.write(nedc_bench_source(shape, size, rng))
+                fnames.append(fname)
+
+            # check it and format the results, discarding the text
+            #
+            context = FinalReport()
+            serial = []
+            start = time.perf_counter()
+            for fname in fnames:
+                result = context.check_files(fname)
+                nedc_format_text(result)
+                serial.append(result)
+            elapsed = time.perf_counter() - start
+
+            totals = context.get_totals()
+            results.append({
+                'shape': shape,
+                'files': totals['files'],
+                'physical lines': totals['physical lines'],
+                'logical lines': totals['logical lines'],
+                'errors': totals['errors'],
+                'seconds': elapsed,
+                'files/s': totals['files'] / elapsed,
+                'lines/s': totals['physical lines'] / elapsed,
+                'logical lines/s': totals['logical lines'] / elapsed,
+                'peak rss (MB)': nedc_bench_rss()})
+
+            # check the same sources from many threads at once, and
+            # compare the results with the serial run
+            #
+            if threads:
+                sources = []
+                for fname in fnames:
+                    with open(fname) as fp:
+                        sources.append((fname, fp.read()))
+                start = time.perf_counter()
+                threaded = nedc_check_threads(sources, threads)
+                seconds = time.perf_counter() - start
+                results[-1].update({
+                    'threads': threads, 'threaded seconds': seconds,
+                    'threaded files/s': len(sources) / seconds,
+                    'threaded match': [(result.filename, result.nedc,
+                                        result.findings)
+                                       for result in threaded] ==
+                                      [(result.filename, result.nedc,
+                                        result.findings)
+                                       for result in serial]})
+
+            # time the fused checks with each engine, and compare what
+            # the engines found. the profile times the checks and the scan
+            # alone, but not the lookups of the fused checks in their
+            # table, so the whole run is also timed without it
+            #
+            if engines:
+                names = [check.__name__ for check in FUSED_LOGICAL_CHECKS]
+                names.append(nedc_fused_groups.__name__)
+                found = {}
+                for fused in (True, False):
+                    engine = 'fused' if fused else 'separate'
+                    context = FinalReport(fused=fused)
+                    start = time.perf_counter()
+                    found[fused] = [context.check_files(fname).findings
+                                    for fname in fnames]
+                    results[-1][engine + ' run seconds'] = \
+                        time.perf_counter() - start
+                    profile = CheckProfile()
+                    context = FinalReport(profile=profile, fused=fused)
+                    for fname in fnames:
+                        context.check_files(fname)
+                    results[-1][engine + ' seconds'] = sum(
+                        profile.stats[name][0] for name in names
+                        if name in profile.stats)
+                results[-1]['engines match'] = found[True] == found[False]
+
+    # print a table of the results
+    #
+    print('%-12s %7s %9s %10s %12s %12s %10s' %
+          ('shape', 'files', 'lines', 'files/s', 'lines/s', 'logical/s',
+           'rss (MB)'))
+    for result in results:
+        print('%-12s %7d %9d %10.1f %12.1f %12.1f %10s' %
+              (result['shape'], result['files'], result['physical lines'],
+               result['files/s'], result['lines/s'],
+               result['logical lines/s'],
+               '%.1f' % result['peak rss (MB)']
+               if result['peak rss (MB)'] is not None else '-'))
+
+    # print the stress run, and fail when a thread got other results
+    #
+    if threads:
+        print('\n%-12s %7s %10s %10s %7s' %
+              ('shape', 'threads', 'seconds', 'files/s', 'match'))
+        for result in results:
+            print('%-12s %7d %10.2f %10.1f %7s' %
+                  (result['shape'], result['threads'],
+                   result['threaded seconds'], result['threaded files/s'],
+                   'yes' if result['threaded match'] else 'NO'))
+
+    # print the engines, and fail when they found other errors
+    #
+    if engines:
+        print('\n%-12s %14s %14s %8s %14s %14s %7s' %
+              ('shape', 'separate (ms)', 'fused (ms)', 'speedup',
+               'separate (s)', 'fused (s)', 'match'))
+        for result in results:
+            print('%-12s %14.1f %14.1f %8.2f %14.2f %14.2f %7s' %
+                  (result['shape'], result['separate seconds'] * 1e3,
+                   result['fused seconds'] * 1e3,
+                   result['separate seconds'] / result['fused seconds']
+                   if result['fused seconds'] else 0.0,
+                   result['separate run seconds'],
+                   result['fused run seconds'],
+                   'yes' if result['engines match'] else 'NO'))
+
+    # write the results with what is needed to compare two runs
+    #
+    if output is not None:
+        with open(__file__, 'rb') as fp:
+            checker = hashlib.blake2b(fp.read(), digest_size=16).hexdigest()
+        with open(output, 'w') as fp:
+            json.dump({'checker': checker,
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'seed': seed, 'files': nfiles, 'size': size,
+                       'results': results}, fp, indent=2)
+            fp.write('\n')
+    if not all(result.get('threaded match', True) for result in results):
+        print("Error: %s (line: %s) %s: %s" %
+              (__FILE__, ndt.__LINE__, ndt.__NAME__,
+               "threads found other results than the serial run"))
+        sys.exit(os.EX_SOFTWARE)
+    if not all(result.get('engines match', True) for result in results):
+        print("Error: %s (line: %s) %s: %s" %
+              (__FILE__, ndt.__LINE__, ndt.__NAME__,
+               "the fused checks found other errors than the separate ones"))
+        sys.exit(os.EX_SOFTWARE)
+    return results
+
+# function: main
+#
+def main(argv):
+
+    # create a command line parser
+    #
+    cmdl = ncp.Cmdl(USAGE_FILE, HELP_FILE)
+    cmdl.add_argument("files", type = str, nargs = '*')
+    cmdl.add_argument("--jobs", type = int, default = DEF_JOBS)
+    cmdl.add_argument("--cache", type = str, default = None)
+    cmdl.add_argument("--cache-size", type = int, default = DEF_CACHE_SIZE)
+    cmdl.add_argument("--diff", type = str, default = None)
+    cmdl.add_argument("--include", type = str, action = "append")
+    cmdl.add_argument("--exclude", type = str, action = "append",
+                      default = [])
+    cmdl.add_argument("--daemon", type = str, default = None)
+    cmdl.add_argument("--client", type = str, default = None)
+    cmdl.add_argument("--reload", action = "store_true")
+    cmdl.add_argument("--select", type = str, default = None)
+    cmdl.add_argument("--ignore", type = str, default = None)
+    cmdl.add_argument("--baseline-write", type = str, default = None)
+    cmdl.add_argument("--baseline-check", type = str, default = None)
+    cmdl.add_argument("--stream", action = "store_true")
+    cmdl.add_argument("--max-errors-per-file", type = int,
+                      default = DEF_MAX_ERRORS)
+    cmdl.add_argument("--fail-fast", action = "store_true")
+    cmdl.add_argument("--batch-physical", action = "store_true")
+    cmdl.add_argument("--format", type = str, default = DEF_FORMAT,
+                      choices = OUTPUT_FORMATS)
+    cmdl.add_argument("--profile-checks", action = "store_true")
+    cmdl.add_argument("--profile-output", type = str, default = None)
+    cmdl.add_argument("--benchmark", action = "store_true")
+    cmdl.add_argument("--bench-shapes", type = str,
+                      default = ','.join(BENCH_SHAPES))
+    cmdl.add_argument("--bench-files", type = int, default = DEF_BENCH_FILES)
+    cmdl.add_argument("--bench-size", type = int, default = DEF_BENCH_SIZE)
+    cmdl.add_argument("--bench-seed", type = int, default = DEF_BENCH_SEED)
+    cmdl.add_argument("--bench-output", type = str, default = None)
+    cmdl.add_argument("--bench-threads", type = int, default = 0)
+    cmdl.add_argument("--bench-engines", action = "store_true")
+
+    # parse the command line
+    #
+    args = cmdl.parse_args()
+
+    # measure the checker on a generated corpus instead of checking files
+    #
+    if args.benchmark:
+        nedc_benchmark(args.bench_shapes.split(','), args.bench_files,
+                       args.bench_size, args.bench_seed, args.bench_output,
+                       args.bench_threads, args.bench_engines)
+        return
+
+    # a streamed file is never held in memory, which the incremental
+    # mode, the baseline and the daemon all need
+    #
+    if args.stream and (args.diff is not None or args.daemon is not None or
+                        args.client is not None or
+                        args.baseline_write is not None or
+                        args.baseline_check is not None):
+        print("Error: %s (line: %s) %s: %s" %
+              (__FILE__, ndt.__LINE__, ndt.__NAME__,
+               "--stream cannot be used with --diff, --daemon, --client "
+               "or a baseline"))
+        sys.exit(os.EX_SOFTWARE)
+
+    # the daemon answers with whole results, so it cannot stop early
+    #
+    if (args.max_errors_per_file or args.fail_fast) and \
+       (args.daemon is not None or args.client is not None):
+        print("Error: %s (line: %s) %s: %s" %
+              (__FILE__, ndt.__LINE__, ndt.__NAME__,
+               "--max-errors-per-file and --fail-fast cannot be used with "
+               "--daemon or --client"))
+        sys.exit(os.EX_SOFTWARE)
+
+    # in incremental mode, check the files changed since a git revision,
+    # otherwise expand the lists into python scripts
+    #
+    changes = None
+    if args.diff is not None:
+        changes = nedc_git_changes(args.diff)
+        files = nedc_diff_files(changes)
+    else:
+        files = nedc_expand_files(args.files, args.include, args.exclude,
+                                  args.stream)
+
+    # use all the cores when the number of jobs is zero
+    #
+    jobs = args.jobs or os.cpu_count() or DEF_JOBS
+
+    # write the results in the format asked for
+    #
+    writer = {'text': TextWriter, 'jsonl': JsonlWriter,
+              'sarif': SarifWriter}[args.format]()
+
+    # send the files to a daemon instead of checking them
+    #
+    if args.client is not None:
+        nedc_client(args.client, args.files, args.reload, args.include,
+                    args.exclude, writer)
+        return
+
+    # keep only the checks of the codes selected and not ignored
+    #
+    selection = None
+    if args.select is not None or args.ignore is not None:
+        selection = CodeSelection(
+            [code.strip() for code in (args.select or '').split(',')
+             if code.strip()],
+            [code.strip() for code in (args.ignore or '').split(',')
+             if code.strip()])
+
+    # report only the findings missing from a baseline, or write one
+    #
+    baseline = None
+    if args.baseline_write is not None:
+        baseline = Baseline(writing=True)
+    elif args.baseline_check is not None:
+        baseline = Baseline()
+        try:
+            baseline.read(nft.get_fullpath(args.baseline_check))
+        except (OSError, ValueError) as e:
+            print("Error: %s (line: %s) %s: cannot read the baseline (%s)" %
+                  (__FILE__, ndt.__LINE__, ndt.__NAME__, e))
+            sys.exit(os.EX_SOFTWARE)
+
+    # open the result cache, shared by all the workers
+    #
+    cache = None
+    if args.cache is not None:
+        cache = ResultCache(nft.get_fullpath(args.cache),
+                            args.cache_size << 20, selection)
+
+    # run as a daemon, until it is stopped
+    #
+    if args.daemon is not None:
+        nedc_serve(args.daemon, cache, selection)
+        return
+
+    # time each check when asked to
+    #
+    profile = CheckProfile() if args.profile_checks else None
+
+    # run the checker on the files
+    #
+    if jobs > 1:
+        totals = nedc_check_parallel(files, jobs, cache, changes, profile,
+                                     writer, selection, baseline, args.stream,
+                                     args.max_errors_per_file, args.fail_fast,
+                                     args.batch_physical)
+    else:
+        totals = nedc_check_serial(files, cache, changes, profile, writer,
+                                   selection, baseline, args.stream,
+                                   args.max_errors_per_file, args.fail_fast,
+                                   args.batch_physical)
+
+    # store the findings of the run as the new baseline
+    #
+    if baseline is not None and baseline.writing:
+        baseline.write(nft.get_fullpath(args.baseline_write))
+
+    # print the time spent in each check, on the standard error when the
+    # standard output is for a machine
+    #
+    if profile is not None:
+        profile.print_table(args.profile_output,
+                            sys.stderr if writer.machine else None)
+
+    # evict the least recently used results
+    #
+    if cache is not None:
+        cache.prune()
+
+    # a run stopped at a failing file fails
+    #
+    if totals['stopped']:
+        sys.exit(DEF_FAIL_STATUS)
 #
 # end of main
 